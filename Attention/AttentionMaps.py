@@ -0,0 +1,91 @@
+import os
+import zipfile
+import numpy as np
+import torch
+import Attentiontrain
+from Attentiontrain import build_model
+from Attentiontrain import update_config
+from Attentiontrain import load_dataset
+from Alphabets import EOS_char
+from Helpers import Helper
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+class AttentionMapWriter:
+    '''
+        Streams per example attention maps into a compressed .npz archive
+        Every example is written as soon as it is decoded (key "000000", "000001", ...) as a float16
+        [predicted_len, source_len] array, the (source, prediction) words are stored under "words" on close.
+        Read it back with np.load(path)
+    '''
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+        self.words = []
+
+    def write(self, attention_map, source_word, predicted_word):
+        with self.archive.open(f'{len(self.words):06d}.npy', 'w') as f:
+            np.save(f, attention_map.astype(np.float16))
+        self.words.append((source_word, predicted_word))
+
+    def close(self):
+        with self.archive.open('words.npy', 'w') as f:
+            np.save(f, np.array(self.words, dtype=str).reshape(-1, 2))
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+'''
+    Converts a column of indices into a word, stopping at the first <EOS>
+    Returns the word and the number of indices up to and including <EOS>
+'''
+def indices_to_word(indices, vocab):
+    eos = vocab.char2index[EOS_char]
+    chars = []
+    for index in indices:
+        if index == eos:
+            return ''.join(chars), len(chars) + 1
+        chars.append(vocab.index2char[index])
+    return ''.join(chars), len(chars)
+
+
+def main(args):
+    dataset = load_dataset(args)
+    config = update_config(args, dataset)
+    model = Helper.LoadCheckpoint(build_model(config), args.model_path, map_location=device)
+    model.eval()
+    _, _, test_dataloader = dataset.DataSetLoader(args.batch_size)
+
+    written = 0
+    with AttentionMapWriter(args.output) as writer, torch.no_grad():
+        for input_seq, target_seq in test_dataloader:
+            input_seq = Helper.TrimBatch(torch.transpose(input_seq, 0, 1).to(device))
+            target_seq = Helper.TrimBatch(torch.transpose(target_seq, 0, 1).to(device))
+            output, attn_matrix = model(input_seq, target_seq, teacher_force_ratio=0.0, return_attention=True)
+            predictions = output.argmax(dim=2).cpu().numpy()
+            attn_matrix = attn_matrix.cpu().numpy()
+            sources = input_seq.cpu().numpy()
+            for b in range(sources.shape[1]):
+                source_word, source_len = indices_to_word(sources[:, b], dataset.english_vocab)
+                predicted_word, predicted_len = indices_to_word(predictions[1:, b], dataset.target_vocab)
+                # Row 0 belongs to <SOS>, keep the decoded characters (and <EOS>) over the real source characters
+                writer.write(attn_matrix[1:1 + predicted_len, b, :source_len], source_word, predicted_word)
+                written += 1
+                if written == args.num_examples:
+                    break
+            if written == args.num_examples:
+                break
+    print(f"Wrote {written} attention maps to {args.output} ({os.path.getsize(args.output) / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    parser = Attentiontrain.get_parser()
+    parser.description = "Decodes the test set and streams the per example attention maps to a compressed archive"
+    parser.add_argument('-o','--output',type=str,default='attention_maps.npz',help='Path of the compressed archive')
+    parser.add_argument('-n','--num_examples',type=int,default=-1,help='Number of examples to write, -1 for the whole test set')
+    args = parser.parse_args()
+    main(args)
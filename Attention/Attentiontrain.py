@@ -1,10 +1,14 @@
 import torch
-import torch.nn as nn
 from Helpers import Helper
+from Helpers import PadAwareLoss
 from Seq2Seq import Encoder
 from Seq2Seq import Decoder
 from Seq2Seq import LangToLang
+from Transformer import TransformerEncoder
+from Transformer import TransformerDecoder
+from Transformer import TransformerLangToLang
 from CreateDataset import DataPreparation
+from CreateDataset import MultilingualDataPreparation
 import argparse
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -18,19 +22,22 @@ class TrainingAndValidation :
             Trained Model
             Dataloader - > Train,Test,Validation
             batch_size
+            criterion -> pad aware loss, a default one is created if not given
         Returns :
-            Loss and Accuracy of the model on the dataloader
+            Loss per target token and Accuracy of the model on the dataloader
     '''
     
     @staticmethod
-    def evaluateModel(model, dataloader, batch_size):
-        criterion = nn.CrossEntropyLoss()  # Define the loss function
+    def evaluateModel(model, dataloader, batch_size, criterion=None):
+        if criterion is None:
+            criterion = PadAwareLoss()  # Define the loss function
         model.eval()  # Put the model in evaluation mode
-        loss_epoch = 0  # Initialize the epoch loss to zero
+        loss_epoch = 0  # Initialize the summed token loss to zero
+        n_tokens = 0  # Initialize the count of non padding target tokens to zero
         correct = 0  # Initialize the count of correct predictions to zero
         
         with torch.no_grad():  # No need to calculate gradients during evaluation
-            for batch_idx, (input_seq, target_seq) in enumerate(dataloader):
+            for batch_idx, (input_seq, target_seq, *_) in enumerate(dataloader):  # Extra tensors (e.g. teacher soft targets) are not needed here
                 '''
                 We need to match the dimensions of the input to
                 multiply the dimensions; that's why we are doing the transpose here.
@@ -40,6 +47,8 @@ class TrainingAndValidation :
                 '''
                 input_seq = torch.transpose(input_seq, 0, 1).to(device)  # Transpose and move input to the device
                 target_seq = torch.transpose(target_seq, 0, 1).to(device)  # Transpose and move target to the device
+                input_seq = Helper.TrimBatch(input_seq)  # Drop the rows which are padding for the whole batch
+                target_seq = Helper.TrimBatch(target_seq)
 
                 # As we are in evaluation mode, we are keeping the teacher force ratio to be 0.0
                 output, _ = model(input_seq, target_seq, teacher_force_ratio=0.0)  # Get model output
@@ -56,11 +65,13 @@ class TrainingAndValidation :
                 target = target_seq[1:].reshape(-1)  # Exclude the first token and flatten
                 
                 loss = criterion(output, target)  # Calculate the loss
-                loss_epoch += loss.item()  # Accumulate the loss for the epoch
+                batch_tokens = criterion.token_count(target).item()
+                loss_epoch += loss.item() * batch_tokens  # Accumulate the summed loss for the epoch
+                n_tokens += batch_tokens
 
             accuracy = correct / (len(dataloader) * batch_size)  # Calculate accuracy
             accuracy = accuracy * 100.0  # Convert to percentage
-            loss_epoch /= len(dataloader)  # Average the loss over all batches
+            loss_epoch /= max(n_tokens, 1)  # Average the loss over all target tokens
             return loss_epoch, accuracy  # Return the epoch loss and accuracy
 
 
@@ -72,14 +83,18 @@ class TrainingAndValidation :
             3. Number of epochs to be run
             4. batch_size
             5. Learning_rate
+            6. label_smoothing (optional)
+            7. criterion (optional) -> replaces the pad aware loss, extra tensors of a training batch
+               ([batchsize, max_seq_len, k] each, e.g. teacher soft targets) are passed on to it
         Returns :
             nothing
         Saves the model at the end of training so that it can be used later on
     '''
 
     @staticmethod    
-    def trainer(model, dataloader, epochs, opt_str, batch_size, learning_rate):
-        criterion = nn.CrossEntropyLoss()  # Define the loss function
+    def trainer(model, dataloader, epochs, opt_str, batch_size, learning_rate, label_smoothing=0.0, criterion=None):
+        if criterion is None:
+            criterion = PadAwareLoss(label_smoothing=label_smoothing)  # Define the loss function, padding positions are ignored
         train_dataloader = dataloader[0]  # Training dataloader
         valid_dataloader = dataloader[1]  # Validation dataloader
 
@@ -90,7 +105,7 @@ class TrainingAndValidation :
             
             model.train()  # Put the model in training mode
 
-            for batch_idx, (input_seq, target_seq) in enumerate(train_dataloader):
+            for batch_idx, (input_seq, target_seq, *extra) in enumerate(train_dataloader):
                 '''
                 We need to match the dimensions of the input to 
                 multiply the dimensions; that's why we are doing the transpose here.
@@ -100,25 +115,29 @@ class TrainingAndValidation :
                 '''
                 input_seq = torch.transpose(input_seq, 0, 1).to(device)  # Transpose and move input to the device
                 target_seq = torch.transpose(target_seq, 0, 1).to(device)  # Transpose and move target to the device
+                input_seq = Helper.TrimBatch(input_seq)  # Drop the rows which are padding for the whole batch
+                target_seq = Helper.TrimBatch(target_seq)
 
                 # Forward pass through the model
-                output, attn = model(input_seq, target_seq)
+                output, _ = model(input_seq, target_seq)
                 output = output[1:].reshape(-1, output.shape[2])  # Exclude the first token and flatten
                 target = target_seq[1:].reshape(-1)  # Exclude the first token and flatten
+                # Extra per position tensors follow the same transpose, trimming and flattening as the target
+                extra = [torch.transpose(t, 0, 1).to(device)[1:target_seq.shape[0]].reshape(target.shape[0], -1) for t in extra]
                 
                 optimizer.zero_grad()  # Zero the gradients
-                loss = criterion(output, target)  # Calculate the loss
+                loss = criterion(output, target, *extra)  # Calculate the loss
                 loss.backward()  # Backward pass to calculate gradients
                 torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1)  # Clip gradients to prevent exploding gradients
                 optimizer.step()  # Update model parameters
 
             # Evaluate model on the training data
-            train_loss, train_acc = TrainingAndValidation.evaluateModel(model, train_dataloader, batch_size)
+            train_loss, train_acc = TrainingAndValidation.evaluateModel(model, train_dataloader, batch_size, criterion)
             print("Training Loss:", train_loss)
             print("Training Accuracy:", train_acc)
 
             # Evaluate model on the validation data
-            val_loss, val_acc = TrainingAndValidation.evaluateModel(model, valid_dataloader, batch_size)
+            val_loss, val_acc = TrainingAndValidation.evaluateModel(model, valid_dataloader, batch_size, criterion)
             print(f"Validation Loss: {val_loss:.2f}")
             print(f"Validation Accuracy: {val_acc:.2f}")
 
@@ -126,7 +145,7 @@ class TrainingAndValidation :
             # wandb.log({'tr_loss' : train_loss, 'tr_acc' : train_acc, 'val_loss' : val_loss, 'val_acc' : val_acc, 'epoch' : epoch+1})
 
         # Save the trained model parameters
-        torch.save(model.state_dict(), model_saving_path)
+        Helper.SaveCheckpoint(model, model_saving_path)
 
 
 
@@ -140,15 +159,24 @@ config = {
         'bidirectional': True,
 }
 
-
-def main(args):
-    inp_lang = 'eng'
-    target_lang  = args.target_lang
-    PATH_TO_DATA = '/content/drive/MyDrive/aksharantar_sampled/' + target_lang
-    model_saving_path = '/best_model_attention.pth'
-    test_pred_path = '/predictions_attention.csv'
+'''
+    Builds the encoder decoder model described by config
+    cell_type = RNN/GRU/LSTM -> recurrent encoder and attention decoder, Transformer -> Transformer encoder decoder
+'''
+def build_model(config):
+    if config['cell_type'] == 'Transformer':
+        encoder = TransformerEncoder(config).to(device)
+        decoder = TransformerDecoder(config).to(device)
+        return TransformerLangToLang(encoder, decoder).to(device)
+    encoder = Encoder(config).to(device)
+    decoder = Decoder(config).to(device)
+    return LangToLang(encoder, decoder).to(device)
 
 
+'''
+    Fills config from the command line arguments and the vocabulary sizes of the dataset
+'''
+def update_config(args, dataset):
     config['cell_type'] = args.cell_type
     config['embedding_size'] = args.embedding_size
     config['hidden_size'] = args.hidden_size
@@ -157,51 +185,92 @@ def main(args):
     config['dropout'] = args.dropout
     config['bidirectional'] =  args.bidirectional
     config['epochs'] = args.epochs
+    config['num_heads'] = args.num_heads
+    config['decoder_step'] = args.decoder_step
+    config['checkpoint_chunk'] = args.checkpoint_chunk
+
+    # Fixed parameters for encoder and decoder
+    config['input_size'] = dataset.english_vocab.n_chars
+    config['output_size'] = dataset.target_vocab.n_chars
+    return config
+
+
+'''
+    Loads the data of the target language, or of all of them for a comma separated list (multilingual model)
+'''
+def load_dataset(args, inp_lang='eng'):
+    target_langs = args.target_lang.split(',')
+    if len(target_langs) > 1:
+        return MultilingualDataPreparation(args.path, target_langs, inp_lang, args.lang_temperature, args.prune_vocab)
+    return DataPreparation(args.path + args.target_lang, inp_lang, args.target_lang, args.prune_vocab)
+
+
+def main(args):
+    global model_saving_path
+    model_saving_path = args.model_path
+    test_pred_path = '/predictions_attention.csv'
 
     epochs = args.epochs
     learning_rate = args.learning_rate
     
 
-    dataset = DataPreparation(PATH_TO_DATA,inp_lang,target_lang)
+    dataset = load_dataset(args)
     batch_size = args.batch_size
     train_dataloader,valid_dataloader,test_dataloader = dataset.DataSetLoader(batch_size);
     
-    # Fixed parameters for encoder and decoder
-    input_size_encoder = dataset.english_vocab.n_chars
-    input_size_decoder = dataset.target_vocab.n_chars
-    output_size = input_size_decoder
-    
-    config['input_size'] = input_size_encoder
-    config['output_size'] = output_size
-    config['bidirectional'] = True
-    encoder = Encoder(config).to(device)
-    decoder = Decoder(config).to(device)
-    
-    model = LangToLang(encoder, decoder).to(device)
+    update_config(args, dataset)
+    model = build_model(config)
     opt_str = args.optimizer
-    TrainingAndValidation.trainer(model,(train_dataloader,valid_dataloader),epochs,opt_str,batch_size,learning_rate)
+    TrainingAndValidation.trainer(model,(train_dataloader,valid_dataloader),epochs,opt_str,batch_size,learning_rate,args.label_smoothing)
 
-    model.load_state_dict(torch.load(model_saving_path))
-    test_loss,test_accuracy = TrainingAndValidation.evaluateModel(model,test_dataloader,nn.CrossEntropyLoss(),batch_size,(dataset.TestDataFrame,True))
+    Helper.LoadCheckpoint(model, model_saving_path, map_location=device)
+    if args.restrict_output:
+        model.decoder.restrict_output(dataset.output_indices())
+    test_loss,test_accuracy = TrainingAndValidation.evaluateModel(model,test_dataloader,batch_size)
     print(f"Test Loss: {test_loss:.2f}")
     print(f"Test Accuracy: {test_accuracy:.2f}")
+    if isinstance(dataset, MultilingualDataPreparation):
+        for lang, lang_dataloader in dataset.LanguageTestLoaders(batch_size).items():
+            if args.restrict_output:
+                model.decoder.restrict_output(dataset.output_indices(lang))  # Only the script of this language
+            _, lang_accuracy = TrainingAndValidation.evaluateModel(model,lang_dataloader,batch_size)
+            print(f"Test Accuracy ({lang}): {lang_accuracy:.2f}")
 
 
-if __name__ == "__main__":
+'''
+    Command line arguments of the trainer, shared with the other scripts which rebuild a trained model
+'''
+def get_parser():
     parser = argparse.ArgumentParser(description="Deep_LearingAssignment1_CS23M062 -command line arguments")
     parser.add_argument("-wp","--wandb_project", type=str, default ='Shubhodeep_CS6190_DeepLearing_Assignment3', help="Project name used to track experiments in Weights & Biases dashboard")
     parser.add_argument("-we","--wandb_entity", type=str, default ='shubhodeepiitm062',help="Wandb Entity used to track experiments in the Weights & Biases dashboard.")
     parser.add_argument("-e","--epochs",type=int,default = 10,help ='Number of epochs to train neural network.')
     parser.add_argument("-b","--batch_size",type=int,default = 32,help='Batch size used to train neural network.')  
     parser.add_argument('-lr','--learning_rate',type=float,default=0.001,help='Learning rate used to optimize model parameters')
-    parser.add_argument('-t','--target_lang',type=str,default='hin',help='Target Language in which transliteration system works')
-    parser.add_argument('-ct',"--cell_type",type=str,default="LSTM",help='Type of cell to be used in architecture Choose b/w [LSTM,RNN,GRU]')
+    parser.add_argument('-t','--target_lang',type=str,default='hin',help='Target Language in which transliteration system works, a comma separated list (hin,ben,tel) trains one multilingual model')
+    parser.add_argument('-ct',"--cell_type",type=str,default="LSTM",help='Type of cell to be used in architecture Choose b/w [LSTM,RNN,GRU,Transformer]')
     parser.add_argument('-em','--embedding_size',type=int,default=128,help='size of embedding to be used in encoder decoder')
     parser.add_argument('-hi','--hidden_size',type=int,default=512,help='Hidden layer size of encoder and decoder')
     parser.add_argument('-el',"--encoder_layers",type=int,default=4,help='Number of hidden layers in encoder')
     parser.add_argument('-dl',"--decoder_layers",type=int,default=4,help='Number of hidden layers in decoder')
     parser.add_argument('-dr','--dropout',type=float,default=0.2,help='dropout probability')
-    parser.add_argument('-bi',"--bidirectional",type=bool,default=True,help='Whether you want the data to be read from both directions')
+    parser.add_argument('-bi',"--bidirectional",type=lambda x: x.lower() == 'true',default=True,help='Whether you want the data to be read from both directions')
     parser.add_argument('-op','--optimizer',type=str,default='Adam',help='choices: ["Sgd","Adam", "Nadam"]')  
+    parser.add_argument('-nh','--num_heads',type=int,default=4,help='Number of attention heads, only used when cell_type is Transformer')
+    parser.add_argument('-ls','--label_smoothing',type=float,default=0.0,help='Label smoothing used in the pad aware loss')
+    parser.add_argument('-ds','--decoder_step',type=str,default='default',choices=['default','fused','compiled'],help='Decoder time step implementation of the recurrent attention decoder')
+    parser.add_argument('-lt','--lang_temperature',type=float,default=5.0,help='Language mixing temperature of the multilingual training batches (1 = data proportions)')
+    parser.add_argument('-pv','--prune_vocab',type=lambda x: x.lower() == 'true',default=False,help='Target vocabulary only holds the characters seen in the data instead of the whole Unicode block')
+    parser.add_argument('-ro','--restrict_output',type=lambda x: x.lower() == 'true',default=False,help='Test with the output projection restricted to the characters seen in training (per language for multilingual models)')
+    parser.add_argument('-cc','--checkpoint_chunk',type=int,default=0,help='Activation checkpointing over chunks of this many decoder time steps and the encoder (every layer for the Transformer), 0 = off')
+    parser.add_argument('-p','--path',type=str,default='/content/drive/MyDrive/aksharantar_sampled/',help='Folder containing the language folders of the dataset')
+    parser.add_argument('-m','--model_path',type=str,default='/best_model_attention.pth',help='Where the trained model is saved')
+    return parser
+
+
+if __name__ == "__main__":
+    parser = get_parser()
     args = parser.parse_args()
+    if args.restrict_output and args.cell_type == 'Transformer':
+        parser.error("--restrict_output is only supported by the recurrent attention decoder, not by the Transformer")
     main(args)
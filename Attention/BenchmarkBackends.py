@@ -0,0 +1,112 @@
+import time
+import os
+import tempfile
+import torch
+import Attentiontrain
+from Attentiontrain import TrainingAndValidation
+from Attentiontrain import build_model
+from Helpers import Helper
+from Helpers import PadAwareLoss
+from CreateDataset import DataPreparation
+import argparse
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+class BackendBenchmark:
+    '''
+        Measures the training throughput (words/sec of forward + backward with teacher forcing)
+        Inputs : model, dataloader, number of batches to time
+    '''
+    @staticmethod
+    def trainingThroughput(model, dataloader, n_batches):
+        criterion = PadAwareLoss()
+        optimizer = Helper.Optimizer(model, 'Adam', 1e-3)
+        model.train()
+        words = 0
+        start = time.perf_counter()
+        for batch_idx, (input_seq, target_seq) in enumerate(dataloader):
+            if batch_idx == n_batches:
+                break
+            input_seq = Helper.TrimBatch(torch.transpose(input_seq, 0, 1).to(device))
+            target_seq = Helper.TrimBatch(torch.transpose(target_seq, 0, 1).to(device))
+            output, _ = model(input_seq, target_seq)
+            loss = criterion(output[1:].reshape(-1, output.shape[2]), target_seq[1:].reshape(-1))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            words += input_seq.shape[1]
+        return words / (time.perf_counter() - start)
+
+    '''
+        Measures the greedy decoding throughput (words/sec, teacher_force_ratio = 0)
+    '''
+    @staticmethod
+    def inferenceThroughput(model, dataloader, n_batches):
+        model.eval()
+        words = 0
+        start = time.perf_counter()
+        with torch.no_grad():
+            for batch_idx, (input_seq, target_seq) in enumerate(dataloader):
+                if batch_idx == n_batches:
+                    break
+                input_seq = Helper.TrimBatch(torch.transpose(input_seq, 0, 1).to(device))
+                target_seq = Helper.TrimBatch(torch.transpose(target_seq, 0, 1).to(device))
+                model(input_seq, target_seq, teacher_force_ratio=0.0)
+                words += input_seq.shape[1]
+        return words / (time.perf_counter() - start)
+
+
+def main(args):
+    dataset = DataPreparation(args.path + args.target_lang, 'eng', args.target_lang)
+    train_dataloader, valid_dataloader, test_dataloader = dataset.DataSetLoader(args.batch_size)
+
+    results = []
+    for cell_type in args.cell_types.split(','):
+        torch.manual_seed(0)
+        config = dict(Attentiontrain.config)
+        config.update({
+            'cell_type': cell_type,
+            'embedding_size': args.embedding_size,
+            'hidden_size': args.hidden_size,
+            'enc_num_layers': args.encoder_layers,
+            'dec_num_layers': args.decoder_layers,
+            'num_heads': args.num_heads,
+            'input_size': dataset.english_vocab.n_chars,
+            'output_size': dataset.target_vocab.n_chars,
+        })
+        model = build_model(config)
+        n_params = sum(p.numel() for p in model.parameters())
+
+        # Train with the regular trainer so that accuracies are comparable with Attentiontrain.py runs
+        Attentiontrain.model_saving_path = os.path.join(tempfile.gettempdir(), 'benchmark_' + cell_type + '.pth')
+        start = time.perf_counter()
+        TrainingAndValidation.trainer(model, (train_dataloader, valid_dataloader), args.epochs, 'Adam', args.batch_size, args.learning_rate)
+        train_time = time.perf_counter() - start
+        _, test_accuracy = TrainingAndValidation.evaluateModel(model, test_dataloader, args.batch_size)
+
+        train_wps = BackendBenchmark.trainingThroughput(model, train_dataloader, args.timed_batches)
+        infer_wps = BackendBenchmark.inferenceThroughput(model, test_dataloader, args.timed_batches)
+        results.append((cell_type, n_params, train_time, train_wps, infer_wps, test_accuracy))
+
+    print('====================================')
+    print(f"{'cell_type':<12}{'params':>12}{'train time(s)':>15}{'train words/s':>15}{'infer words/s':>15}{'test acc':>10}")
+    for cell_type, n_params, train_time, train_wps, infer_wps, test_accuracy in results:
+        print(f"{cell_type:<12}{n_params:>12}{train_time:>15.1f}{train_wps:>15.1f}{infer_wps:>15.1f}{test_accuracy:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and accuracy comparison of the encoder decoder backends")
+    parser.add_argument('-p','--path',type=str,default='/content/drive/MyDrive/aksharantar_sampled/',help='Folder containing the language folders of the dataset')
+    parser.add_argument('-t','--target_lang',type=str,default='hin',help='Target Language in which transliteration system works')
+    parser.add_argument('-c','--cell_types',type=str,default='LSTM,Transformer',help='Comma separated list of cell types to compare')
+    parser.add_argument("-e","--epochs",type=int,default = 10,help ='Number of epochs to train each model.')
+    parser.add_argument("-b","--batch_size",type=int,default = 32,help='Batch size used to train and evaluate.')
+    parser.add_argument('-lr','--learning_rate',type=float,default=0.001,help='Learning rate used to optimize model parameters')
+    parser.add_argument('-em','--embedding_size',type=int,default=128,help='size of embedding to be used in encoder decoder')
+    parser.add_argument('-hi','--hidden_size',type=int,default=512,help='Hidden layer size (feed forward size for the Transformer)')
+    parser.add_argument('-el',"--encoder_layers",type=int,default=4,help='Number of layers in encoder')
+    parser.add_argument('-dl',"--decoder_layers",type=int,default=4,help='Number of layers in decoder')
+    parser.add_argument('-nh','--num_heads',type=int,default=4,help='Number of attention heads of the Transformer')
+    parser.add_argument('-tb','--timed_batches',type=int,default=50,help='Number of batches used for the throughput measurements')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,125 @@
+import time
+import torch
+from Seq2Seq import Encoder
+from Seq2Seq import Decoder
+from Seq2Seq import LangToLang
+import argparse
+
+def build(cell_type, args):
+    config = {
+        'cell_type': cell_type,
+        'input_size': args.input_size,
+        'output_size': args.output_size,
+        'embedding_size': args.embedding_size,
+        'hidden_size': args.hidden_size,
+        'enc_num_layers': args.encoder_layers,
+        'dec_num_layers': args.decoder_layers,
+        'dropout': 0.2,
+        'bidirectional': True,
+    }
+    torch.manual_seed(0)
+    model = LangToLang(Encoder(config), Decoder(config))
+    model.eval()
+    return model
+
+
+def max_difference(a, b):
+    if a is None:
+        return 0.0
+    return (a - b).abs().max().item()
+
+
+def check_step(model, source, x, mode):
+    enc_out, hidden, cell = model.encoder(source)
+    hidden = hidden.repeat(model.decoder.num_layers, 1, 1)
+    if cell is not None:
+        cell = cell.repeat(model.decoder.num_layers, 1, 1)
+    reference = model.decoder(x, enc_out, hidden, cell)
+    model.decoder.step_mode = mode
+    stepped = model.decoder.step(x, model.decoder.attention_keys(enc_out), hidden, cell)
+    return max(max_difference(r, f) for r, f in zip(reference, stepped))
+
+
+def check_decode(model, source, target, mode):
+    model.decoder.step_mode = 'default'
+    reference, _ = model(source, target, teacher_force_ratio=0.0)
+    model.decoder.step_mode = mode
+    decoded, _ = model(source, target, teacher_force_ratio=0.0)
+    return max_difference(reference, decoded)
+
+
+def time_step(model, source, x, mode, repeats):
+    enc_out, hidden, cell = model.encoder(source)
+    hidden = hidden.repeat(model.decoder.num_layers, 1, 1)
+    if cell is not None:
+        cell = cell.repeat(model.decoder.num_layers, 1, 1)
+    keys = model.decoder.attention_keys(enc_out)
+    model.decoder.step_mode = mode
+
+    def run():
+        if mode == 'default':
+            return model.decoder(x, enc_out, hidden, cell)
+        return model.decoder.step(x, keys, hidden, cell)
+
+    for _ in range(5):
+        run()  # Warm up, and compilation for the compiled mode
+    start = time.perf_counter()
+    for _ in range(repeats):
+        run()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def time_decode(model, source, target, mode, repeats):
+    model.decoder.step_mode = mode
+    model(source, target, teacher_force_ratio=0.0)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model(source, target, teacher_force_ratio=0.0)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+'''
+    Checks that the fused and compiled decoder steps give the same results as Decoder.forward (one step and a whole greedy decode)
+    and measures the CPU latency of one decoder step and of a whole greedy decode for every mode
+'''
+def main(args):
+    torch.set_num_threads(args.threads)
+    modes = ['default', 'fused', 'compiled']
+    checked = ['fused', 'compiled']
+    print(f"{'cell':<6}" + ''.join(f"{m + ' |diff| step':>22}{m + ' |diff| decode':>24}" for m in checked) + ''.join(f"{m + ' step ms':>18}" for m in modes) + ''.join(f"{m + ' decode ms':>20}" for m in modes))
+    with torch.no_grad():
+        for cell_type in args.cell_types.split(','):
+            model = build(cell_type, args)
+            source = torch.randint(3, args.input_size, (args.source_len, args.batch_size))
+            target = torch.zeros(args.target_len, args.batch_size, dtype=torch.long)
+            x = torch.randint(3, args.output_size, (args.batch_size,))
+
+            differences = []
+            for mode in checked:
+                step_difference = check_step(model, source, x, mode)
+                decode_difference = check_decode(model, source, target, mode)
+                assert model.decoder.step_mode == mode, f"{mode} decoder step fell back to {model.decoder.step_mode}"
+                assert step_difference < 1e-4 and decode_difference < 1e-4, f"{mode} decoder step differs from Decoder.forward"
+                differences += [step_difference, decode_difference]
+
+            step_ms = [time_step(model, source, x, mode, args.repeats) for mode in modes]
+            decode_ms = [time_decode(model, source, target, mode, max(1, args.repeats // args.target_len)) for mode in modes]
+            print(f"{cell_type:<6}" + ''.join(f"{v:>22.2e}{w:>24.2e}" for v, w in zip(differences[::2], differences[1::2])) + ''.join(f"{v:>18.3f}" for v in step_ms) + ''.join(f"{v:>20.2f}" for v in decode_ms))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Equivalence and CPU latency of the default, fused and compiled decoder steps")
+    parser.add_argument('-c','--cell_types',type=str,default='LSTM,GRU,RNN',help='Comma separated list of cell types')
+    parser.add_argument('-b','--batch_size',type=int,default=1,help='Batch size of a step')
+    parser.add_argument('-em','--embedding_size',type=int,default=128,help='size of embedding')
+    parser.add_argument('-hi','--hidden_size',type=int,default=512,help='Hidden layer size')
+    parser.add_argument('-el','--encoder_layers',type=int,default=4,help='Number of encoder layers')
+    parser.add_argument('-dl','--decoder_layers',type=int,default=4,help='Number of decoder layers')
+    parser.add_argument('-is','--input_size',type=int,default=29,help='Input vocabulary size')
+    parser.add_argument('-os','--output_size',type=int,default=131,help='Output vocabulary size')
+    parser.add_argument('-sl','--source_len',type=int,default=12,help='Source length')
+    parser.add_argument('-tl','--target_len',type=int,default=14,help='Number of decoded steps')
+    parser.add_argument('-r','--repeats',type=int,default=500,help='Number of timed steps')
+    parser.add_argument('-th','--threads',type=int,default=1,help='torch intra-op threads')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,105 @@
+import os
+import time
+import torch
+from torch.utils.data import DataLoader
+import Attentiontrain
+from Attentiontrain import build_model
+from Attentiontrain import update_config
+from Attentiontrain import load_dataset
+from Helpers import Helper
+from CreateDataset import MultilingualDataPreparation
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+'''
+    Milliseconds of one decoder output step on a [batchsize, 2 * hidden_size] input :
+    the output projection followed by the log softmax and argmax over its outputs
+'''
+def projection_latency(decoder, batch_size, repeats):
+    features = torch.randn(batch_size, decoder.hidden_size * 2, device=device)
+
+    def run():
+        return decoder.vocab_index(torch.log_softmax(decoder.project(features), dim=1).argmax(dim=1))
+
+    with torch.no_grad():
+        run()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            run()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+'''
+    Seconds of a greedy decode of the batches and the word accuracy, predictions are mapped back to vocabulary indices
+'''
+def decode(model, batches):
+    correct, words = 0, 0
+    start = time.perf_counter()
+    with torch.no_grad():
+        for input_seq, target_seq in batches:
+            output, _ = model(input_seq, target_seq, teacher_force_ratio=0.0)
+            pred_seq = model.decoder.vocab_index(output.argmax(dim=2))
+            correct += torch.logical_or(pred_seq == target_seq, target_seq == 2).all(dim=0).sum().item()
+            words += target_seq.shape[1]
+    return time.perf_counter() - start, correct / words * 100.0
+
+
+'''
+    Full vs restricted (full width outputs) vs compact (only the kept logits) output projection :
+    rows, FLOPs of the projection per decoder step of a batch, per step latency of projection + softmax + argmax,
+    test decode time and accuracy. Every mode decodes one batch as a warm up before it is timed.
+'''
+def compare(name, model, indices, dataloader, args):
+    decoder = model.decoder
+    # Same unshuffled batches for every mode
+    batches = [(Helper.TrimBatch(torch.transpose(input_seq, 0, 1).to(device)), Helper.TrimBatch(torch.transpose(target_seq, 0, 1).to(device)))
+               for input_seq, target_seq in DataLoader(dataloader.dataset, batch_size=args.batch_size, shuffle=False)]
+    modes = ('full', 'restricted', 'compact')
+    results = {}
+    for mode in modes:
+        decoder.restrict_output(None if mode == 'full' else indices, compact=mode == 'compact')
+        rows = decoder.output_size if mode == 'full' else len(indices)
+        flops = 2 * decoder.hidden_size * 2 * rows * args.batch_size  # 2 FLOPs per multiply-add of the [2 * hidden_size] x [rows] projection, per example
+        step_ms = projection_latency(decoder, args.batch_size, args.repeats)
+        decode(model, batches[:1])  # Warm up
+        decode_s, accuracy = decode(model, batches)
+        results[mode] = (rows, flops, step_ms, decode_s, accuracy)
+    decoder.restrict_output(None)
+
+    for mode, (n_rows, flops, step_ms, decode_s, accuracy) in results.items():
+        print(f"{name:<8}{mode:<16}{n_rows:>6}{flops / 1e3:>14.1f}{step_ms:>14.4f}{decode_s:>12.3f}{accuracy:>10.2f}")
+    full = results['full']
+    for mode in modes[1:]:
+        reduced = results[mode]
+        print(f"{name:<8}{mode + ' gain':<16}{full[0] / reduced[0]:>5.1f}x{full[1] / reduced[1]:>13.1f}x{full[2] / reduced[2]:>13.1f}x{full[3] / reduced[3]:>11.1f}x")
+
+
+def main(args):
+    if args.cell_type == 'Transformer':
+        print('restrict_output is only implemented for the recurrent attention decoder')
+        return
+    dataset = load_dataset(args)
+    config = update_config(args, dataset)
+    model = build_model(config)
+    if os.path.exists(args.model_path):
+        Helper.LoadCheckpoint(model, args.model_path, map_location=device)
+    else:
+        print('No checkpoint at', args.model_path, '- timing an untrained model')
+    model.eval()
+
+    print(f"FLOPs per decoder step of a batch of {args.batch_size}, ms/step = projection + log softmax + argmax")
+    print(f"{'lang':<8}{'projection':<16}{'rows':>6}{'kFLOP/step':>14}{'ms/step':>14}{'decode s':>12}{'test acc':>10}")
+    if isinstance(dataset, MultilingualDataPreparation):
+        for lang, dataloader in dataset.LanguageTestLoaders(args.batch_size).items():
+            compare(lang, model, dataset.output_indices(lang), dataloader, args)
+    else:
+        _, _, test_dataloader = dataset.DataSetLoader(args.batch_size)
+        compare(args.target_lang, model, dataset.output_indices(), test_dataloader, args)
+
+
+if __name__ == "__main__":
+    parser = Attentiontrain.get_parser()
+    parser.description = "Per step FLOPs and latency of the full vs script restricted (full width or compact) output projection"
+    parser.add_argument('-r','--repeats',type=int,default=1000,help='Number of timed projection calls')
+    args = parser.parse_args()
+    main(args)
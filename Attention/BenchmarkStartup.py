@@ -0,0 +1,124 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import torch
+import Attentiontrain
+from Attentiontrain import build_model
+from Helpers import Helper
+
+'''
+    Rss and Pss (proportional share, shared pages divided between the processes using them) of a process in MB
+'''
+def memory_of(pid):
+    memory = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                name, value = line.split(':', 1)
+                if name in ('Rss', 'Pss'):
+                    memory[name] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return memory.get('Rss', float('nan')), memory.get('Pss', float('nan'))
+
+
+'''
+    Body of one worker : builds the model, loads the weights with the chosen path and waits until the parent has measured it
+    load  -> current path, model.load_state_dict(torch.load(path))
+    mmap  -> Helper.LoadCheckpoint, tensors memory mapped from the checkpoint
+'''
+def child(mode, config, path):
+    start = time.perf_counter()
+    model = build_model(config).cpu()
+    if mode == 'mmap':
+        Helper.LoadCheckpoint(model, path)
+    else:
+        model.load_state_dict(torch.load(path, map_location='cpu'))
+    print(json.dumps({'load_ms': (time.perf_counter() - start) * 1000}), flush=True)
+    sys.stdin.read()
+
+
+'''
+    Asks the kernel to drop the cached pages of the checkpoint, so that the next worker reads it from disk
+    Best effort (posix_fadvise is advisory), returns False where it is not available
+'''
+def evict_from_page_cache(path):
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+'''
+    Starts args.processes workers loading the checkpoint with the given mode at once
+    Returns the mean startup time (s), mean load time (ms), mean Rss per process and total Pss (MB)
+'''
+def run_mode(mode, config, args):
+    start = time.perf_counter()
+    workers = [subprocess.Popen([sys.executable, __file__, '--child', mode, json.dumps(config), args.model_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for _ in range(args.processes)]
+    startup, load_ms = [], []
+    for worker in workers:
+        load_ms.append(json.loads(worker.stdout.readline())['load_ms'])
+        startup.append(time.perf_counter() - start)
+    memory = [memory_of(worker.pid) for worker in workers]  # Measured while every worker is still alive
+    for worker in workers:
+        worker.stdin.close()
+        worker.wait()
+    return sum(startup) / len(startup), sum(load_ms) / len(load_ms), sum(m[0] for m in memory) / len(memory), sum(m[1] for m in memory)
+
+
+def main(args):
+    state_dict = torch.load(args.model_path, map_location='cpu', mmap=True, weights_only=True)  # Only the header is read, the tensors stay on disk
+    config = dict(Attentiontrain.config)
+    config.update({
+        'cell_type': args.cell_type,
+        'embedding_size': args.embedding_size,
+        'hidden_size': args.hidden_size,
+        'enc_num_layers': args.encoder_layers,
+        'dec_num_layers': args.decoder_layers,
+        'dropout': args.dropout,
+        'bidirectional': args.bidirectional,
+        'num_heads': args.num_heads,
+        'input_size': state_dict['encoder.embedding.weight'].shape[0],
+        'output_size': state_dict['decoder.embedding.weight'].shape[0],
+    })
+    size_mb = sum(t.numel() * t.element_size() for t in state_dict.values()) / 2 ** 20
+    del state_dict
+    cold = not args.warm and evict_from_page_cache(args.model_path)
+    print(f"Checkpoint {args.model_path}: {size_mb:.1f} MB of tensors, {args.processes} concurrent processes per mode, {args.rounds} rounds")
+    if cold:
+        print("Page cache: checkpoint evicted before every run (posix_fadvise, best effort)")
+    else:
+        print("Page cache: warm, the checkpoint may already be in memory, so load times do not include disk reads")
+
+    # The mode order alternates between rounds, so that neither mode always runs right after the other
+    results = {'load': [], 'mmap': []}
+    for round_index in range(args.rounds):
+        for mode in (('load', 'mmap') if round_index % 2 == 0 else ('mmap', 'load')):
+            if cold:
+                evict_from_page_cache(args.model_path)
+            results[mode].append(run_mode(mode, config, args))
+
+    print(f"{'mode':<6}{'startup s':>11}{'load ms':>10}{'Rss/proc MB':>13}{'Pss/proc MB':>13}{'Pss total MB':>14}")
+    for mode, runs in results.items():
+        startup, load_ms, rss, pss = [sum(values) / len(values) for values in zip(*runs)]
+        print(f"{mode:<6}{startup:>11.2f}{load_ms:>10.1f}{rss:>13.1f}{pss / args.processes:>13.1f}{pss:>14.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], json.loads(sys.argv[3]), sys.argv[4])
+    else:
+        parser = Attentiontrain.get_parser()
+        parser.description = "Startup time and memory of worker processes loading the checkpoint with torch.load vs memory mapping"
+        parser.add_argument('-np','--processes',type=int,default=4,help='Number of worker processes started at once')
+        parser.add_argument('-rn','--rounds',type=int,default=3,help='Number of rounds, the mode order alternates between rounds')
+        parser.add_argument('-wc','--warm',action='store_true',help='Keep the checkpoint in the page cache instead of evicting it before every run')
+        args = parser.parse_args()
+        main(args)
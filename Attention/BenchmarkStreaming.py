@@ -0,0 +1,80 @@
+import os
+import time
+import torch
+import Attentiontrain
+from Attentiontrain import build_model
+from Attentiontrain import update_config
+from Helpers import Helper
+from CreateDataset import DataPreparation
+from Streaming import StreamingSession
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+'''
+    Latency summary in milliseconds : mean, median, 95th percentile and maximum
+'''
+def summary(latencies):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return sum(latencies) / n, latencies[n // 2], latencies[min(n - 1, int(0.95 * n))], latencies[-1]
+
+
+def main(args):
+    dataset = DataPreparation(args.path + args.target_lang, 'eng', args.target_lang, args.prune_vocab)
+    config = update_config(args, dataset)
+    model = build_model(config)
+    if os.path.exists(args.model_path):
+        Helper.LoadCheckpoint(model, args.model_path, map_location=device)
+    else:
+        print('No checkpoint at', args.model_path, '- timing an untrained model')
+    model.eval()
+
+    # Baseline : the same beam search (width, step and time budget, stop rule) on a fresh session for every keystroke,
+    # so the comparison only measures what the streaming session reuses between keystrokes
+    session = StreamingSession(model, dataset.english_vocab, dataset.target_vocab, args.beam_width, deadline_ms=args.deadline_ms, reuse_stable=args.reuse_stable, commit_after=args.commit_after)
+    fresh = StreamingSession(model, dataset.english_vocab, dataset.target_vocab, args.beam_width, deadline_ms=args.deadline_ms, reuse_stable=False)
+    words = dataset.test_data[:args.num_words]
+    stream_latencies = []
+    fresh_latencies = []
+    correct = 0
+    fresh_correct = 0
+    same_top1 = 0
+    for english, target in words:
+        session.reset()
+        for i, char in enumerate(english):
+            start = time.perf_counter()
+            candidates = session.append(char)
+            stream_latencies.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            fresh.reset()
+            fresh_candidates = fresh.append(english[:i + 1])
+            fresh_latencies.append((time.perf_counter() - start) * 1000)
+        best = candidates[0][0] if candidates else ''
+        fresh_best = fresh_candidates[0][0] if fresh_candidates else ''
+        correct += best == target
+        fresh_correct += fresh_best == target
+        same_top1 += best == fresh_best
+
+    print(f"Replayed {len(words)} words, {len(stream_latencies)} keystrokes, beam width {args.beam_width}")
+    print(f"{'per keystroke (ms)':<22}{'mean':>8}{'p50':>8}{'p95':>8}{'max':>8}")
+    for name, latencies in (('streaming session', stream_latencies), ('fresh beam search', fresh_latencies)):
+        print(f"{name:<22}" + ''.join(f"{value:>8.2f}" for value in summary(latencies)))
+    print(f"Decoder steps reused from the committed prefix: {session.reused_steps}")
+    # The memo is cleared for every word, the keystrokes of a replayed word never repeat a prefix so this should be 0
+    print(f"Memo hits: {session.memo_hits} of {session.memo_lookups} keystrokes ({session.memo_hits / max(session.memo_lookups, 1) * 100.0:.1f}%)")
+    print(f"Final top-1 identical to the fresh beam search: {same_top1 / len(words) * 100.0:.2f}%")
+    print(f"Top-1 accuracy of the fresh beam search: {fresh_correct / len(words) * 100.0:.2f}")
+    print(f"Top-1 accuracy of the final candidates: {correct / len(words) * 100.0:.2f}")
+
+
+if __name__ == "__main__":
+    parser = Attentiontrain.get_parser()
+    parser.description = "Replays test words one character at a time through the streaming session"
+    parser.add_argument('-n','--num_words',type=int,default=500,help='Number of test words to replay')
+    parser.add_argument('-bw','--beam_width',type=int,default=3,help='Number of candidates kept per keystroke')
+    parser.add_argument('-dm','--deadline_ms',type=float,default=None,help='Per keystroke time budget of the beam search')
+    parser.add_argument('-rs','--reuse_stable',type=lambda x: x.lower() == 'true',default=True,help='Resume the beam search from the committed (stable) characters of the previous keystroke')
+    parser.add_argument('-ca','--commit_after',type=int,default=3,help='Keystrokes a character must stay unchanged before it is committed')
+    args = parser.parse_args()
+    main(args)
@@ -3,6 +3,7 @@ from Helpers import Helper
 import torch
 from torch.utils.data import DataLoader
 from torch.utils.data import TensorDataset
+from torch.utils.data import WeightedRandomSampler
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -31,9 +32,8 @@ class DataPreparation:
     '''
         Constructor initializes all the variables   
     '''
-    def __init__(self, path, inp_lang='eng', target_lang='hin'):
+    def __init__(self, path, inp_lang='eng', target_lang='hin', prune_vocab=False):
         eng_alphabets = 'abcdefghijklmnopqrstuvwxyz'  # English alphabets
-        tar_alphabets = self.target_language_alphabets(target_lang)  # Target language alphabets
 
         # Load datasets from CSV files
         self.TrainDataFrame = pd.read_csv(path + '/' + target_lang + '_train.csv', header=None)
@@ -43,10 +43,36 @@ class DataPreparation:
         self.TestDataFrame = pd.read_csv(path + '/' + target_lang + '_test.csv', header=None)
         self.test_data = self.TestDataFrame.values
 
+        if prune_vocab:
+            tar_alphabets = self.seen_alphabets([self.train_data], [self.valid_data, self.test_data])
+        else:
+            tar_alphabets = self.target_language_alphabets(target_lang)  # Target language alphabets
+
         # Build vocabulary for the input and target languages
         new_data = [[eng_alphabets, tar_alphabets]]
         self.english_vocab, self.target_vocab = Helper.LanguageVocabulary(new_data, inp_lang, target_lang)
 
+    '''
+        Target characters which actually occur in the data, used instead of the whole Unicode block with prune_vocab
+        Inputs :  train -> list of training arrays, others -> list of validation / test arrays
+        Returns : training characters followed by the few characters only present in the other splits
+                  (these can never be predicted correctly but keep the evaluation data encodable)
+    '''
+    def seen_alphabets(self, train, others):
+        seen = set(''.join(word for data in train for word in data[:, 1]))
+        extra = set(''.join(word for data in others for word in data[:, 1])) - seen
+        if extra:
+            print(len(extra), 'target characters only appear outside the training data')
+        return ''.join(sorted(seen)) + ''.join(sorted(extra))
+
+    '''
+        Output indices the model can produce for this data : <SOS>, <EOS>, padding and every target character seen in training
+        Used with Decoder.restrict_output to shrink the output projection at inference
+    '''
+    def output_indices(self):
+        seen = set(''.join(self.train_data[:, 1]))
+        return [0, 1, 2] + sorted(self.target_vocab.char2index[char] for char in seen)
+
     '''
         Function which converts all the training,validation and test data into a tensor dataset and then into an dataloader 
         Inputs :  Batch size
@@ -76,3 +102,80 @@ class DataPreparation:
         test_dataloader = DataLoader(test_dataset, batch_size=batch_size, shuffle=True)
 
         return train_dataloader, valid_dataloader, test_dataloader
+
+class MultilingualDataPreparation(DataPreparation):
+    '''
+        Joint data of several target languages for one multilingual model
+        Inputs :    path -> folder containing one folder per language, target_langs -> list like ['hin', 'ben', 'tel']
+                    temperature -> language mixing temperature of the training batches
+        The target vocabulary is the union of the scripts of all languages and every input word
+        starts with a language tag token <lang> (added to the input vocabulary) telling the model which script to produce
+    '''
+    def __init__(self, path, target_langs, inp_lang='eng', temperature=5.0, prune_vocab=False):
+        eng_alphabets = 'abcdefghijklmnopqrstuvwxyz'  # English alphabets
+        self.target_langs = target_langs
+        self.temperature = temperature
+
+        # Load the datasets of every language from the CSV files
+        self.train_data, self.valid_data, self.test_data = {}, {}, {}
+        for lang in target_langs:
+            self.train_data[lang] = pd.read_csv(path + lang + '/' + lang + '_train.csv', header=None).values
+            self.valid_data[lang] = pd.read_csv(path + lang + '/' + lang + '_valid.csv', header=None).values
+            self.test_data[lang] = pd.read_csv(path + lang + '/' + lang + '_test.csv', header=None).values
+
+        if prune_vocab:
+            tar_alphabets = self.seen_alphabets(list(self.train_data.values()), list(self.valid_data.values()) + list(self.test_data.values()))
+        else:
+            tar_alphabets = ''.join(self.target_language_alphabets(lang) for lang in target_langs)  # Joint target alphabet
+        new_data = [[eng_alphabets, tar_alphabets]]
+        self.english_vocab, self.target_vocab = Helper.LanguageVocabulary(new_data, inp_lang, '+'.join(target_langs))
+        self.english_vocab.addWordtoDict([self.language_tag(lang) for lang in target_langs])  # One tag token per language
+
+    def language_tag(self, lang):
+        return '<' + lang + '>'
+
+    def output_indices(self, lang=None):
+        # Output indices of one language (its script as seen in training), of all languages when lang is None
+        langs = self.target_langs if lang is None else [lang]
+        seen = set(''.join(word for l in langs for word in self.train_data[l][:, 1]))
+        return [0, 1, 2] + sorted(self.target_vocab.char2index[char] for char in seen)
+
+    '''
+        Probability of drawing a training example of each language, p_lang proportional to n_lang ** (1 / temperature)
+        temperature = 1 -> natural data proportions, large temperature -> close to uniform over the languages
+    '''
+    def language_probabilities(self):
+        sizes = {lang: len(self.train_data[lang]) ** (1.0 / self.temperature) for lang in self.target_langs}
+        total = sum(sizes.values())
+        return {lang: size / total for lang, size in sizes.items()}
+
+    def tensors(self, data, langs):
+        # Input words are prefixed with their language tag, all languages are padded together
+        english = [[self.language_tag(lang)] + list(word) for lang in langs for word in data[lang][:, 0]]
+        target = [word for lang in langs for word in data[lang][:, 1]]
+        english = Helper.DataProcessing(english, self.english_vocab, sent=(False, True)).to(device=device)
+        target = Helper.DataProcessing(target, self.target_vocab, sent=(True, True)).to(device=device)
+        return TensorDataset(english, target)
+
+    '''
+        Training batches mix the languages, every example is drawn with its language probability
+        Returns : train, valid and test dataloaders over all languages
+    '''
+    def DataSetLoader(self, batch_size):
+        train_dataset = self.tensors(self.train_data, self.target_langs)
+        probabilities = self.language_probabilities()
+        weights = []
+        for lang in self.target_langs:
+            weights += [probabilities[lang] / len(self.train_data[lang])] * len(self.train_data[lang])
+        sampler = WeightedRandomSampler(weights, num_samples=len(weights), replacement=True)
+        train_dataloader = DataLoader(train_dataset, batch_size=batch_size, sampler=sampler)
+
+        valid_dataloader = DataLoader(self.tensors(self.valid_data, self.target_langs), batch_size=batch_size, shuffle=True)
+        test_dataloader = DataLoader(self.tensors(self.test_data, self.target_langs), batch_size=batch_size, shuffle=True)
+        return train_dataloader, valid_dataloader, test_dataloader
+
+    '''
+        Returns : dict language -> test dataloader of that language only, for per language accuracies
+    '''
+    def LanguageTestLoaders(self, batch_size):
+        return {lang: DataLoader(self.tensors(self.test_data, [lang]), batch_size=batch_size) for lang in self.target_langs}
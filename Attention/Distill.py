@@ -0,0 +1,169 @@
+import os
+import time
+import torch
+from torch.utils.data import DataLoader
+from torch.utils.data import TensorDataset
+import Attentiontrain
+from Attentiontrain import TrainingAndValidation
+from Attentiontrain import build_model
+from Attentiontrain import update_config
+from Alphabets import EOS_char
+from Helpers import Helper
+from Helpers import DistillationLoss
+from CreateDataset import DataPreparation
+from BenchmarkBackends import BackendBenchmark
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+class TeacherCache:
+    '''
+        Teacher outputs on the training data, computed once and stored on disk
+        soft     -> top-k probabilities (at the distillation temperature) of the teacher at every gold position,
+                    stored as float16 probabilities and int16 indices
+        sequence -> greedy outputs of the teacher, used as the student targets (sequence level distillation)
+        The file is a regular torch checkpoint so it is loaded memory mapped
+        settings records what the cache was built with (mode, top_k, temperature, training data, vocabulary,
+        teacher checkpoint path, size and modification time), a cache whose settings differ from the current run is rebuilt
+    '''
+    @staticmethod
+    def settings(args, dataset):
+        teacher_stat = os.stat(args.model_path)
+        return {
+            'mode': args.distill_mode,
+            'top_k': args.top_k if args.distill_mode == 'soft' else None,
+            'temperature': args.temperature if args.distill_mode == 'soft' else None,
+            'path': os.path.abspath(args.path),
+            'target_lang': args.target_lang,
+            'prune_vocab': args.prune_vocab,
+            'train_rows': len(dataset.train_data),
+            'output_size': dataset.target_vocab.n_chars,
+            'teacher': os.path.abspath(args.model_path),
+            'teacher_size': teacher_stat.st_size,
+            'teacher_mtime': teacher_stat.st_mtime_ns,  # A retrained teacher at the same path invalidates the cache
+        }
+
+    @staticmethod
+    def load(path, settings):
+        # Returns the cache stored in path, or None when it is missing or was built with other settings
+        if not os.path.exists(path):
+            return None
+        cache = torch.load(path, mmap=True, weights_only=True)
+        stale = [f"{name} {cache.get(name)} != {value}" for name, value in settings.items() if cache.get(name) != value]
+        if stale:
+            print('Rebuilding the teacher cache', path, '(' + ', '.join(stale) + ')')
+            return None
+        return cache
+
+    @staticmethod
+    def build(teacher, english, target, settings, batch_size, eos):
+        mode, top_k, temperature = settings['mode'], settings['top_k'], settings['temperature']
+        teacher.eval()
+        topk_idx, topk_prob, teacher_targets = [], [], []
+        with torch.no_grad():
+            for start in range(0, english.shape[0], batch_size):
+                input_seq = torch.transpose(english[start:start + batch_size], 0, 1).to(device)
+                target_seq = torch.transpose(target[start:start + batch_size], 0, 1).to(device)
+                if mode == 'soft':
+                    output, _ = teacher(input_seq, target_seq, teacher_force_ratio=1.0)  # Distributions along the gold prefix
+                    probs, idx = torch.softmax(output / temperature, dim=2).topk(top_k, dim=2)
+                    probs = probs / probs.sum(dim=2, keepdim=True)  # Renormalize over the kept characters
+                    topk_idx.append(torch.transpose(idx, 0, 1).to(torch.int16).cpu())
+                    topk_prob.append(torch.transpose(probs, 0, 1).half().cpu())
+                else:
+                    output, _ = teacher(input_seq, target_seq, teacher_force_ratio=0.0)
+                    prediction = output.argmax(dim=2)
+                    prediction[0] = target_seq[0]  # <SOS>
+                    after_eos = (prediction == eos).long().cumsum(dim=0) - (prediction == eos).long() > 0
+                    prediction[after_eos] = 2  # Everything after the first <EOS> is padding
+                    teacher_targets.append(torch.transpose(prediction, 0, 1).cpu())
+
+        cache = dict(settings, english=english.cpu())
+        if mode == 'soft':
+            cache.update({'target': target.cpu(), 'topk_idx': torch.cat(topk_idx), 'topk_prob': torch.cat(topk_prob)})
+        else:
+            cache['target'] = torch.cat(teacher_targets)
+        return cache
+
+    @staticmethod
+    def dataset(cache):
+        if cache['mode'] == 'soft':
+            return TensorDataset(cache['english'], cache['target'], cache['topk_idx'], cache['topk_prob'])
+        return TensorDataset(cache['english'], cache['target'])
+
+
+'''
+    Parameters, greedy decoding words/sec on the timed batches and test accuracy of a model
+    timed_batches is one fixed list of test batches shared by the teacher and the student, one of them is decoded first as a warm up
+'''
+def report(model, test_dataloader, batch_size, timed_batches):
+    n_params = sum(p.numel() for p in model.parameters())
+    BackendBenchmark.inferenceThroughput(model, timed_batches[:1], 1)  # Warm up
+    words_per_sec = BackendBenchmark.inferenceThroughput(model, timed_batches, len(timed_batches))
+    _, accuracy = TrainingAndValidation.evaluateModel(model, test_dataloader, batch_size)
+    return n_params, words_per_sec, accuracy
+
+
+def main(args):
+    dataset = DataPreparation(args.path + args.target_lang, 'eng', args.target_lang, args.prune_vocab)
+    train_dataloader, valid_dataloader, test_dataloader = dataset.DataSetLoader(args.batch_size)
+    teacher_config = dict(update_config(args, dataset))
+    teacher = Helper.LoadCheckpoint(build_model(teacher_config), args.model_path, map_location=device)
+
+    settings = TeacherCache.settings(args, dataset)
+    cache = None if args.rebuild_cache else TeacherCache.load(args.cache_path, settings)
+    if cache is not None:
+        print('Using the cached teacher outputs in', args.cache_path)
+    else:
+        start = time.perf_counter()
+        english = Helper.DataProcessing(dataset.train_data[:, 0], dataset.english_vocab, sent=(False, True))
+        target = Helper.DataProcessing(dataset.train_data[:, 1], dataset.target_vocab, sent=(True, True))
+        cache = TeacherCache.build(teacher, english, target, settings, args.batch_size, dataset.target_vocab.char2index[EOS_char])
+        torch.save(cache, args.cache_path)
+        print(f"Cached the teacher outputs in {args.cache_path} ({time.perf_counter() - start:.1f} s)")
+    distill_dataloader = DataLoader(TeacherCache.dataset(cache), batch_size=args.batch_size, shuffle=True)
+
+    student_config = dict(teacher_config)
+    student_config.update({
+        'cell_type': args.student_cell_type,
+        'embedding_size': args.student_embedding_size,
+        'hidden_size': args.student_hidden_size,
+        'enc_num_layers': args.student_encoder_layers,
+        'dec_num_layers': args.student_decoder_layers,
+        'bidirectional': args.student_bidirectional,
+    })
+    student = build_model(student_config)
+    criterion = DistillationLoss(args.alpha, args.temperature, label_smoothing=args.label_smoothing) if args.distill_mode == 'soft' else None
+    Attentiontrain.model_saving_path = args.student_path
+    TrainingAndValidation.trainer(student, (distill_dataloader, valid_dataloader), args.epochs, args.optimizer, args.batch_size, args.learning_rate, args.label_smoothing, criterion)
+
+    print('====================================')
+    # Same unshuffled test batches for both models, so that they decode the same words with the same trimmed lengths
+    ordered_test = DataLoader(test_dataloader.dataset, batch_size=args.batch_size, shuffle=False)
+    timed_batches = [batch for _, batch in zip(range(args.timed_batches), ordered_test)]
+    teacher_params, teacher_wps, teacher_accuracy = report(teacher, test_dataloader, args.batch_size, timed_batches)
+    student_params, student_wps, student_accuracy = report(student, test_dataloader, args.batch_size, timed_batches)
+    print(f"{'model':<9}{'params':>12}{'words/s':>12}{'test acc':>10}")
+    print(f"{'teacher':<9}{teacher_params:>12}{teacher_wps:>12.1f}{teacher_accuracy:>10.2f}")
+    print(f"{'student':<9}{student_params:>12}{student_wps:>12.1f}{student_accuracy:>10.2f}")
+    print(f"Speedup: {student_wps / teacher_wps:.2f}x, accuracy gap: {teacher_accuracy - student_accuracy:.2f} points")
+
+
+if __name__ == "__main__":
+    parser = Attentiontrain.get_parser()
+    parser.description = "Distills a trained model (given by the regular model arguments and -m) into a small student"
+    parser.add_argument('-dm','--distill_mode',type=str,default='soft',choices=['soft','sequence'],help='soft = teacher top-k distributions, sequence = teacher greedy outputs as targets')
+    parser.add_argument('-c','--cache_path',type=str,default='teacher_cache.pth',help='On disk store of the teacher outputs')
+    parser.add_argument('-rc','--rebuild_cache',action='store_true',help='Recompute the teacher outputs even if the cache exists')
+    parser.add_argument('-k','--top_k',type=int,default=8,help='Number of teacher probabilities kept per position')
+    parser.add_argument('-T','--temperature',type=float,default=2.0,help='Distillation temperature')
+    parser.add_argument('-a','--alpha',type=float,default=0.5,help='Weight of the gold loss, 1 - alpha goes to the teacher')
+    parser.add_argument('-sp','--student_path',type=str,default='/best_model_student.pth',help='Where the student is saved')
+    parser.add_argument('-sct','--student_cell_type',type=str,default='GRU',help='Cell type of the student')
+    parser.add_argument('-sem','--student_embedding_size',type=int,default=64,help='Embedding size of the student')
+    parser.add_argument('-shi','--student_hidden_size',type=int,default=128,help='Hidden size of the student')
+    parser.add_argument('-sel','--student_encoder_layers',type=int,default=1,help='Encoder layers of the student')
+    parser.add_argument('-sdl','--student_decoder_layers',type=int,default=1,help='Decoder layers of the student')
+    parser.add_argument('-sbi','--student_bidirectional',type=lambda x: x.lower() == 'true',default=True,help='Bidirectional student encoder')
+    parser.add_argument('-tb','--timed_batches',type=int,default=50,help='Number of test batches used for the words/sec measurement')
+    args = parser.parse_args()
+    main(args)
@@ -1,5 +1,6 @@
 from Alphabets import AlphabetCreation
 import torch
+import torch.nn as nn
 from torch import optim
 from torch.nn.utils.rnn import pad_sequence
 
@@ -7,6 +8,53 @@ from torch.nn.utils.rnn import pad_sequence
 SOS_char = "<SOS>"
 EOS_char = "<EOS>"
 PAD_char = "$"
+PAD_index = 2
+
+class PadAwareLoss(nn.Module):
+    '''
+        Cross entropy computed directly on the logits which ignores the padding positions
+        Inputs :  pad_index -> index of the padding character, label_smoothing -> smoothing factor
+        Returns : loss summed over the real tokens and divided by their count
+    '''
+    def __init__(self, pad_index=PAD_index, label_smoothing=0.0):
+        super(PadAwareLoss, self).__init__()
+        self.pad_index = pad_index
+        self.criterion = nn.CrossEntropyLoss(ignore_index=pad_index, label_smoothing=label_smoothing, reduction='sum')
+
+    def token_count(self, target):
+        # Number of positions which actually contribute to the loss
+        return (target != self.pad_index).sum()
+
+    def forward(self, output, target):
+        n_tokens = self.token_count(target).clamp(min=1)  # Avoid division by zero on an all padding batch
+        return self.criterion(output, target) / n_tokens
+
+class DistillationLoss(nn.Module):
+    '''
+        Loss of a student trained on the cached soft targets of a teacher
+        alpha * pad aware cross entropy on the gold targets + (1 - alpha) * temperature^2 * cross entropy
+        between the teacher top-k probabilities (already softened by temperature) and the student distribution at temperature
+        Without teacher tensors it reduces to the pad aware loss, so the regular evaluation keeps working
+    '''
+    def __init__(self, alpha=0.5, temperature=2.0, pad_index=PAD_index, label_smoothing=0.0):
+        super(DistillationLoss, self).__init__()
+        self.alpha = alpha
+        self.temperature = temperature
+        self.pad_index = pad_index
+        self.gold_loss = PadAwareLoss(pad_index, label_smoothing)
+
+    def token_count(self, target):
+        return self.gold_loss.token_count(target)
+
+    def forward(self, output, target, topk_idx=None, topk_prob=None):
+        gold = self.gold_loss(output, target)
+        if topk_idx is None:
+            return gold
+        log_probs = torch.log_softmax(output / self.temperature, dim=1).gather(1, topk_idx.long())
+        soft = -(topk_prob.float() * log_probs).sum(dim=1)  # Cross entropy against the teacher, per position
+        not_pad = (target != self.pad_index).float()
+        soft = (soft * not_pad).sum() / not_pad.sum().clamp(min=1)
+        return self.alpha * gold + (1 - self.alpha) * self.temperature ** 2 * soft
 
 class Helper:
     @staticmethod
@@ -49,6 +97,44 @@ class Helper:
         word_tensor_pad = pad_sequence(tensor_list, padding_value=2, batch_first=True)
         return word_tensor_pad
 
+    '''
+        Removes the trailing rows which are padding for every sequence in the batch
+        Input : seq -> [max_seq_len, batchsize] tensor
+        Returns : seq trimmed to the longest sequence present in the batch
+    '''
+    @staticmethod
+    def TrimBatch(seq, pad_index=PAD_index):
+        not_pad = (seq != pad_index).any(dim=1)  # True for every row holding at least one real character
+        if not not_pad.any():
+            return seq
+        length = not_pad.nonzero()[-1].item() + 1
+        return seq[:length]
+
+    '''
+        Saves the model parameters in the zip checkpoint format, which can be memory mapped when loading
+    '''
+    @staticmethod
+    def SaveCheckpoint(model, path):
+        torch.save(model.state_dict(), path)
+
+    '''
+        Loads a checkpoint into model
+        mmap=True maps the tensors from the file instead of reading them, the parameters then point to the mapped pages
+        (assign=True) so every process loading the same file shares the pages of the OS page cache
+        Falls back to a regular load on torch versions without mmap support
+    '''
+    @staticmethod
+    def LoadCheckpoint(model, path, map_location='cpu', mmap=True):
+        if mmap:
+            try:
+                state_dict = torch.load(path, map_location=map_location, mmap=True, weights_only=True)
+                model.load_state_dict(state_dict, assign=True)
+                return model
+            except TypeError:
+                pass  # torch < 2.1 has neither mmap nor assign
+        model.load_state_dict(torch.load(path, map_location=map_location))
+        return model
+
     ''' 
         Returns the optimizer based on users choice
         Input : opt -> users optimizer = string, learning_rate
@@ -0,0 +1,97 @@
+import os
+import time
+import torch
+import torch.multiprocessing as mp
+
+'''
+    Body of one replica process
+    Pins the process to its cores, sets its own intra-op thread count and decodes the batches it receives
+    A warm-up job (job_id None) is followed by the barrier, so that every replica runs exactly one of them
+    The model parameters either live in shared memory or are memory mapped from the checkpoint,
+    in both cases every replica reads the same pages
+'''
+def replica_worker(model, config, checkpoint_path, cores, num_threads, sos_index, in_queue, out_queue, barrier):
+    if cores is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)  # One replica = one batch at a time, inter-op parallelism only oversubscribes
+    if model is None:
+        from Attentiontrain import build_model
+        from Helpers import Helper
+        model = Helper.LoadCheckpoint(build_model(config).cpu(), checkpoint_path)
+    model.eval()
+    with torch.no_grad():
+        while True:
+            job = in_queue.get()
+            if job is None:
+                break
+            job_id, source, target_len = job
+            start = time.perf_counter()
+            target = torch.full((target_len, source.shape[1]), sos_index, dtype=torch.long)
+            output, _ = model(source, target, teacher_force_ratio=0.0)
+            out_queue.put((job_id, output.argmax(dim=2), (time.perf_counter() - start) * 1000))
+            if job_id is None:
+                barrier.wait()  # Until every replica has run its warm-up job
+
+class ReplicaPool:
+    '''
+        Pool of CPU inference replicas of one LangToLang / TransformerLangToLang model
+        Inputs :
+            model -> trained model, its weights are moved to shared memory once
+                     (None together with config and checkpoint_path -> every replica memory maps the checkpoint)
+            num_replicas -> number of worker processes
+            threads_per_replica -> torch intra-op threads of every worker
+            sos_index -> index of <SOS> in the target vocabulary
+            cores -> cpu ids to pin the workers to, consecutive blocks of threads_per_replica per worker
+        predict(sources, target_len) dispatches [seq_len, batchsize] batches over the replicas
+        and returns the greedy predictions [target_len, batchsize] in the order of sources
+        warmup(source, target_len) runs one batch on every replica (first call costs), call it before timing predict
+    '''
+    def __init__(self, model, num_replicas, threads_per_replica, sos_index, cores=None, config=None, checkpoint_path=None):
+        if cores is None and hasattr(os, 'sched_getaffinity'):
+            cores = sorted(os.sched_getaffinity(0))
+        if model is not None:
+            model = model.cpu().share_memory()
+        context = mp.get_context('spawn')  # Fork is not safe once the parent has started its OpenMP threads
+        self.in_queue = context.Queue()
+        self.out_queue = context.Queue()
+        self.barrier = context.Barrier(num_replicas)
+        self.latencies = []
+        self.workers = []
+        for i in range(num_replicas):
+            replica_cores = None
+            if cores is not None:
+                replica_cores = cores[i * threads_per_replica:(i + 1) * threads_per_replica] or None
+            worker = context.Process(target=replica_worker, args=(model, config, checkpoint_path, replica_cores, threads_per_replica, sos_index, self.in_queue, self.out_queue, self.barrier), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def warmup(self, source, target_len):
+        for _ in self.workers:
+            self.in_queue.put((None, source, target_len))
+        for _ in self.workers:
+            self.out_queue.get()
+
+    def predict(self, sources, target_len):
+        for job_id, source in enumerate(sources):
+            self.in_queue.put((job_id, source, target_len))
+        predictions = [None] * len(sources)
+        self.latencies = []
+        for _ in range(len(sources)):
+            job_id, prediction, latency = self.out_queue.get()
+            predictions[job_id] = prediction
+            self.latencies.append(latency)
+        return predictions
+
+    def close(self):
+        for _ in self.workers:
+            self.in_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,119 @@
+import resource
+import torch
+import torch.multiprocessing as mp
+import Attentiontrain
+from Attentiontrain import build_model
+from Helpers import Helper
+from Helpers import PadAwareLoss
+
+'''
+    Body of one trial, run in a fresh process so that its peak resident memory only belongs to this configuration
+    Builds the model and optimizer, runs one training step on a synthetic batch of the longest sequences
+    and reports the peak memory in MB (peak RSS on CPU, peak allocated memory on CUDA)
+'''
+def trial(config, batch_size, source_len, target_len, result_queue):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    try:
+        model = build_model(config)
+        model.train()
+        optimizer = Helper.Optimizer(model, 'Adam', 1e-3)
+        criterion = PadAwareLoss()
+        source = torch.randint(3, config['input_size'], (source_len, batch_size), device=device)
+        target = torch.randint(3, config['output_size'], (target_len, batch_size), device=device)
+
+        for _ in range(2):  # The second step also holds the optimizer state
+            output, _ = model(source, target)
+            loss = criterion(output[1:].reshape(-1, output.shape[2]), target[1:].reshape(-1))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+        if device.type == 'cuda':
+            peak_mb = torch.cuda.max_memory_allocated() / 2 ** 20
+        else:
+            peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is in KB on Linux
+        result_queue.put(peak_mb)
+    except RuntimeError:
+        result_queue.put(float('inf'))  # Out of memory
+
+class MemoryPlanner:
+    '''
+        Finds the largest batch size whose training step fits in a memory budget
+        Inputs : config -> model config, budget_mb -> memory limit, source_len / target_len -> longest sequences of the data
+        peaks holds the measured peak memory of every tried batch size
+    '''
+    def __init__(self, config, budget_mb, source_len, target_len):
+        self.config = config
+        self.budget_mb = budget_mb
+        self.source_len = source_len
+        self.target_len = target_len
+        self.context = mp.get_context('spawn')
+        self.peaks = {}
+
+    def peak(self, batch_size):
+        if batch_size not in self.peaks:
+            result_queue = self.context.Queue()
+            process = self.context.Process(target=trial, args=(self.config, batch_size, self.source_len, self.target_len, result_queue))
+            process.start()
+            process.join()
+            self.peaks[batch_size] = result_queue.get() if process.exitcode == 0 else float('inf')  # Killed by the OS = does not fit
+        return self.peaks[batch_size]
+
+    def fits(self, batch_size):
+        return self.peak(batch_size) <= self.budget_mb
+
+    def largest_batch_size(self, max_batch_size):
+        # Doubling until the budget is exceeded, then binary search between the last fitting and the first failing size
+        if not self.fits(1):
+            return 0
+        low = 1
+        while low * 2 <= max_batch_size and self.fits(low * 2):
+            low *= 2
+        high = min(low * 2, max_batch_size + 1)
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self.fits(middle):
+                low = middle
+            else:
+                high = middle
+        return low
+
+
+def main(args):
+    config = dict(Attentiontrain.config)
+    config.update({
+        'cell_type': args.cell_type,
+        'embedding_size': args.embedding_size,
+        'hidden_size': args.hidden_size,
+        'enc_num_layers': args.encoder_layers,
+        'dec_num_layers': args.decoder_layers,
+        'dropout': args.dropout,
+        'bidirectional': args.bidirectional,
+        'num_heads': args.num_heads,
+        'decoder_step': args.decoder_step,
+        'input_size': args.input_size,
+        'output_size': args.output_size,
+    })
+
+    print(f"Budget {args.budget_mb:.0f} MB, source length {args.source_len}, target length {args.target_len}")
+    print(f"{'checkpoint_chunk':>17}{'batch size':>12}{'peak MB':>10}")
+    for chunk in [int(c) for c in args.chunks.split(',')]:
+        planner = MemoryPlanner(dict(config, checkpoint_chunk=chunk), args.budget_mb, args.source_len, args.target_len)
+        best = planner.largest_batch_size(args.max_batch_size)
+        for batch_size, peak_mb in sorted(planner.peaks.items()):
+            print(f"{chunk:>17}{batch_size:>12}{peak_mb:>10.0f}{'' if peak_mb <= args.budget_mb else '  over budget'}")
+        print(f"{chunk:>17}{'-> ' + str(best):>12}")
+
+
+if __name__ == "__main__":
+    parser = Attentiontrain.get_parser()
+    parser.description = "Largest training batch size that fits a memory budget, with and without activation checkpointing"
+    parser.add_argument('-bm','--budget_mb',type=float,default=4096,help='Memory budget in MB (process RSS on CPU, allocated memory on CUDA)')
+    parser.add_argument('-ch','--chunks',type=str,default='0,8,4,2',help='Comma separated checkpoint_chunk values to plan for, 0 = no checkpointing')
+    parser.add_argument('-mb','--max_batch_size',type=int,default=4096,help='Largest batch size tried')
+    parser.add_argument('-sl','--source_len',type=int,default=26,help='Longest source sequence (with <EOS>)')
+    parser.add_argument('-tl','--target_len',type=int,default=24,help='Longest target sequence (with <SOS> and <EOS>)')
+    parser.add_argument('-is','--input_size',type=int,default=29,help='Input vocabulary size')
+    parser.add_argument('-os','--output_size',type=int,default=131,help='Output vocabulary size')
+    args = parser.parse_args()
+    main(args)
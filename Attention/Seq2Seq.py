@@ -2,6 +2,8 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import random
+import warnings
+from torch.utils.checkpoint import checkpoint
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -33,10 +35,10 @@ class Encoder(nn.Module):
         hidden = None
         cell = None
         outputs, cell_data = self.cell(embedding)  # Forward pass through the recurrent cell
-        hidden = cell_data[0]
-
-        if len(cell_data) == 2:
-            cell = cell_data[1]
+        if self.cell_type == "LSTM":
+            hidden, cell = cell_data  # LSTM returns (hidden, cell), GRU/RNN only the hidden state tensor
+        else:
+            hidden = cell_data
 
         if self.bidir:
             # For bidirectional cells, combine the forward and backward hidden states
@@ -80,6 +82,10 @@ class Decoder(nn.Module):
         self.cell = self.create_cell(config['dropout'])  # Recurrent cell
         self.fc1 = nn.Linear(self.hidden_size * 2, self.output_size)  # Fully connected layer for output
         self.fc2 = nn.Linear(self.hidden_size, self.hidden_size, bias=False)  # Fully connected layer for attention mechanism
+        self.step_mode = config.get('decoder_step', 'default')  # default / fused / compiled, see step()
+        self.compiled_step = None
+        self.output_rows = None  # Output indices kept by restrict_output(), None = full projection
+        self.compact_output = False  # restrict_output(..., compact=True) : the projection only returns the kept logits
     
     def change_mat(self, mat, dim1, dim2, dim3):
         # Helper function to permute the dimensions of a tensor
@@ -111,32 +117,177 @@ class Decoder(nn.Module):
             outputs, hidden = self.cell(new_embedding, hidden)  # RNN/GRU cell forward pass
 
         concat_outputs = torch.cat([outputs, context_tensor], dim=2)  # Concatenate outputs and context
-        predictions = self.fc1(concat_outputs)  # Linear transformation for output prediction
+        predictions = self.project(concat_outputs)  # Linear transformation for output prediction
         predictions = predictions.squeeze(0)
         
         return predictions, hidden, cell, attention_weights  # Return predictions, hidden state, cell state, and attention weights
 
+    '''
+        Restricts the output projection to the given output indices (e.g. the characters of one script seen in training)
+        Only these rows of fc1 are multiplied at every step.
+        compact = False -> the other outputs get a very low score, the outputs keep the full vocabulary width
+                           (losses and accuracies stay comparable, but the softmax / argmax still run over output_size)
+        compact = True  -> only the len(indices) kept logits are returned, so the softmax / argmax shrink as well,
+                           output column j is vocabulary index output_rows[j] (see vocab_index)
+        Inference only : call it after training / loading the weights, restrict_output(None) restores the full projection
+    '''
+    def restrict_output(self, indices, compact=False):
+        if indices is None:
+            self.output_rows = None
+            self.compact_output = False
+            return
+        self.compact_output = compact
+        self.output_rows = torch.tensor(sorted(indices), device=self.fc1.weight.device)
+        self.restricted_weight = self.fc1.weight.detach()[self.output_rows]
+        self.restricted_bias = self.fc1.bias.detach()[self.output_rows]
+
+    def project(self, features):
+        if self.output_rows is None:
+            return self.fc1(features)
+        logits = F.linear(features, self.restricted_weight, self.restricted_bias)
+        if self.compact_output:
+            return logits
+        predictions = logits.new_full(features.shape[:-1] + (self.output_size,), -1e9)  # Finite, so losses stay finite
+        predictions[..., self.output_rows] = logits
+        return predictions
+
+    def projection_size(self):
+        # Width of the decoder outputs
+        return len(self.output_rows) if self.compact_output else self.output_size
+
+    def vocab_index(self, indices):
+        # Maps output columns (e.g. an argmax) to vocabulary indices, only differs with a compact restricted projection
+        return self.output_rows[indices] if self.compact_output else indices
+
+    '''
+        Projects the encoder outputs for attention once per sequence
+        Returns keys of shape [batchsize, seq_len, hidden_size], used by step() at every time step
+    '''
+    def attention_keys(self, encoder_outputs):
+        return self.fc2(encoder_outputs).permute(1, 0, 2)
+
+    def cell_step(self, x, hidden, cell):
+        # One time step of the stacked recurrent cell using the weights of self.cell directly,
+        # which skips the full sequence machinery of nn.LSTM/GRU/RNN for a sequence of length 1
+        new_hidden = []
+        new_cell = []
+        for layer in range(self.num_layers):
+            weights = (getattr(self.cell, f'weight_ih_l{layer}'), getattr(self.cell, f'weight_hh_l{layer}'),
+                       getattr(self.cell, f'bias_ih_l{layer}'), getattr(self.cell, f'bias_hh_l{layer}'))
+            if self.cell_type == "LSTM":
+                h, c = torch.lstm_cell(x, (hidden[layer], cell[layer]), *weights)
+                new_cell.append(c)
+            elif self.cell_type == "GRU":
+                h = torch.gru_cell(x, hidden[layer], *weights)
+            else:
+                h = torch.rnn_tanh_cell(x, hidden[layer], *weights)
+            new_hidden.append(h)
+            x = h
+            if layer < self.num_layers - 1:
+                x = F.dropout(x, self.cell.dropout, self.training)  # Same inter layer dropout as the stacked cell
+        return torch.stack(new_hidden), torch.stack(new_cell) if self.cell_type == "LSTM" else None
+
+    '''
+        Fused single step decoder, same result as forward() but takes the precomputed attention keys
+        and works on [batchsize, ...] tensors with bmm, without the permutes and the per step fc2 projection
+    '''
+    def fused_step(self, target_alphabet, keys, hidden, cell):
+        embedding = self.dropout(self.embedding(target_alphabet))  # [batchsize, embedding_size]
+        score_tensor = torch.bmm(keys, hidden[-1].unsqueeze(2)).squeeze(2)  # [batchsize, seq_len]
+        attention_weights = F.softmax(score_tensor, dim=1)
+        context_tensor = torch.bmm(attention_weights.unsqueeze(1), keys).squeeze(1)  # [batchsize, hidden_size]
+        hidden, cell = self.cell_step(torch.cat([embedding, context_tensor], dim=1), hidden, cell)
+        predictions = self.project(torch.cat([hidden[-1], context_tensor], dim=1))
+        return predictions, hidden, cell, attention_weights.unsqueeze(0)
+
+    '''
+        Decoder step used by LangToLang when step_mode is fused or compiled
+        compiled -> fused_step compiled with torch.compile (inductor), falls back to the eager fused_step
+                    when torch.compile is missing or compilation fails on the first call
+    '''
+    def step(self, target_alphabet, keys, hidden, cell):
+        if self.step_mode == 'compiled':
+            if self.compiled_step is not None:
+                return self.compiled_step(target_alphabet, keys, hidden, cell)
+            if not hasattr(torch, 'compile'):
+                warnings.warn("torch.compile is not available, using the eager fused decoder step")
+                self.step_mode = 'fused'
+            else:
+                compiled_step = torch.compile(self.fused_step, dynamic=True)
+                try:
+                    result = compiled_step(target_alphabet, keys, hidden, cell)  # Compilation happens in this first call
+                except Exception as error:
+                    # An error of fused_step itself is raised again by the eager call, only a compiler / backend failure gets past it
+                    result = self.fused_step(target_alphabet, keys, hidden, cell)
+                    warnings.warn(f"torch.compile failed ({type(error).__name__}), using the eager fused decoder step")
+                    self.step_mode = 'fused'
+                    return result
+                self.compiled_step = compiled_step
+                return result
+        return self.fused_step(target_alphabet, keys, hidden, cell)
+
 class LangToLang(nn.Module):
     def __init__(self, encoder, decoder):
         super(LangToLang, self).__init__()
         self.encoder = encoder
         self.decoder = decoder
+        self.checkpoint_chunk = decoder.config.get('checkpoint_chunk', 0)  # 0 = no activation checkpointing
 
-    def forward(self, source, target, teacher_force_ratio=0.5):
-        outputs = torch.zeros(target.shape[0], source.shape[1], self.decoder.output_size).to(device)  # Initialize output tensor
-        enc_out, hidden, cell = self.encoder(source)  # Encode the source sequence
+    '''
+        return_attention -> also return the [target_len, batchsize, source_len] attention matrix,
+        off by default so that training does not build a matrix it throws away (attn_matrix is None then)
+        The step outputs are stacked once at the end, row 0 (the <SOS> position) stays zero
+        With a compact restricted projection the outputs only have decoder.projection_size() columns,
+        their argmax is mapped back to vocabulary indices with decoder.vocab_index
+
+        With checkpoint_chunk > 0 (training only) the encoder and every chunk of checkpoint_chunk decoder time steps
+        run under activation checkpointing : only the chunk boundaries (input token, hidden and cell state) are kept
+        and the activations inside a chunk are recomputed during backward
+    '''
+    def forward(self, source, target, teacher_force_ratio=0.5, return_attention=False):
+        checkpointing = self.checkpoint_chunk > 0 and self.training and torch.is_grad_enabled() and not return_attention
+        if checkpointing:
+            enc_out, hidden, cell = checkpoint(self.encoder, source, use_reentrant=False)
+        else:
+            enc_out, hidden, cell = self.encoder(source)  # Encode the source sequence
         hidden = hidden.repeat(self.decoder.num_layers, 1, 1)  # Repeat hidden state for each decoder layer
         if self.decoder.cell_type == "LSTM":
             cell = cell.repeat(self.decoder.num_layers, 1, 1)
 
-        attn_matrix = torch.zeros(target.shape[0], source.shape[1], source.shape[0]).to(device)  # Initialize attention matrix
+        first_row = torch.zeros(source.shape[1], self.decoder.projection_size(), device=source.device)
+        attn_rows = [torch.zeros(source.shape[1], source.shape[0], device=source.device)] if return_attention else None
+
+        fused = self.decoder.step_mode != 'default'
+        keys = self.decoder.attention_keys(enc_out) if fused else None  # Attention projection computed once, not per step
+
+        # Teacher forcing choices are drawn up front, so that a recomputed chunk takes the same path
+        force = [None] + [random.random() < teacher_force_ratio for _ in range(1, target.shape[0])]
 
         x = target[0]  # Start with the first target token
-        for i in range(1, target.shape[0]):
-            output, hidden, cell, attn_w = self.decoder(x, enc_out, hidden, cell)  # Decode the next token
-            outputs[i] = output  # Store the output
-            attn_matrix[i] = attn_w  # Store the attention weights
-            best_guess = output.argmax(dim=1)  # Get the best guess for the next token
-            x = target[i] if random.random() < teacher_force_ratio else best_guess  # Use teacher forcing or predicted token
+        if not checkpointing:
+            outputs, x, hidden, cell = self.decode_steps(1, target.shape[0], x, target, force, enc_out, keys, hidden, cell, attn_rows, first_row)
+        else:
+            blocks = [first_row.unsqueeze(0)]
+            for start in range(1, target.shape[0], self.checkpoint_chunk):
+                end = min(start + self.checkpoint_chunk, target.shape[0])
+                block, x, hidden, cell = checkpoint(self.decode_steps, start, end, x, target, force, enc_out, keys, hidden, cell, use_reentrant=False)
+                blocks.append(block)
+            outputs = torch.cat(blocks)
 
+        attn_matrix = torch.stack(attn_rows) if return_attention else None
         return outputs, attn_matrix  # Return the output predictions and attention matrix
+
+    def decode_steps(self, start, end, x, target, force, enc_out, keys, hidden, cell, attn_rows=None, first_row=None):
+        # Decodes the time steps start .. end - 1, returns their stacked outputs and the state after the last step
+        outputs = [] if first_row is None else [first_row]
+        for i in range(start, end):
+            if keys is not None:
+                output, hidden, cell, attn_w = self.decoder.step(x, keys, hidden, cell)
+            else:
+                output, hidden, cell, attn_w = self.decoder(x, enc_out, hidden, cell)  # Decode the next token
+            outputs.append(output)  # Store the output
+            if attn_rows is not None:
+                attn_rows.append(attn_w.squeeze(0))  # Store the attention weights
+            best_guess = self.decoder.vocab_index(output.argmax(dim=1))  # Get the best guess for the next token
+            x = target[i] if force[i] else best_guess  # Use teacher forcing or predicted token
+        return torch.stack(outputs), x, hidden, cell
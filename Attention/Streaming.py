@@ -0,0 +1,291 @@
+import time
+import torch
+from collections import OrderedDict
+import torch.nn.functional as F
+from Alphabets import SOS_char
+from Alphabets import EOS_char
+from Alphabets import PAD_char
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+class RecurrentStepper:
+    '''
+        Runs the encoder and the attention decoder of LangToLang one step at a time
+        A unidirectional encoder is advanced by one character per keystroke, its state is kept between keystrokes.
+        A bidirectional encoder depends on the whole word, so it is re-run on the prefix (chunk = whole prefix).
+        With the incremental encoder the outputs of the typed characters never change, only the <EOS> output does.
+        A saved decoder state (state) which put (almost) no attention on <EOS> (tail_attention) can be restored (restore)
+        after the next keystroke to resume decoding from it. It is not exact : the decoder starts from the final
+        encoder state, which the next keystroke changes.
+    '''
+    def __init__(self, model):
+        self.model = model
+        self.encoder = model.encoder
+        self.decoder = model.decoder
+        self.incremental = not self.encoder.bidir
+        self.resumable = self.incremental  # A bidirectional encoding changes everywhere on every keystroke
+
+    def encode_char(self, index, state):
+        # Advance the encoder state by one character, returns (output of the step, new state)
+        embedding = self.encoder.embedding(torch.tensor([[index]], device=device))
+        return self.encoder.cell(embedding, state)
+
+    def encode(self, source_indices, enc_state, eos_index):
+        if self.incremental:
+            outputs, state = enc_state
+            eos_output, final_state = self.encode_char(eos_index, state)  # EOS is fed on a copy, the prefix state stays open
+            enc_out = torch.cat(outputs + [eos_output], dim=0)
+            hidden = final_state[0] if self.encoder.cell_type == "LSTM" else final_state
+            cell = final_state[1][-1:] if self.encoder.cell_type == "LSTM" else None
+            hidden = hidden[-1:]
+        else:
+            source = torch.tensor(source_indices + [eos_index], device=device).unsqueeze(1)
+            enc_out, hidden, cell = self.encoder(source)
+
+        self.enc_out = enc_out
+        self.hidden = hidden.repeat(self.decoder.num_layers, 1, 1)
+        self.cell = cell.repeat(self.decoder.num_layers, 1, 1) if self.decoder.cell_type == "LSTM" else None
+
+    def step(self, x):
+        enc_out = self.enc_out.expand(-1, x.shape[0], -1)
+        output, self.hidden, self.cell, self.attention = self.decoder(x, enc_out, self.hidden, self.cell)
+        return output
+
+    def tail_attention(self, positions):
+        # Attention weight of every beam on the last source positions (<EOS> and the last typed characters)
+        return self.attention[0, :, -positions:].sum(dim=1).tolist()
+
+    def reorder(self, beam_idx):
+        self.hidden = self.hidden.index_select(1, beam_idx)
+        if self.cell is not None:
+            self.cell = self.cell.index_select(1, beam_idx)
+
+    def state(self):
+        # Decoder state of every beam, the tensors are replaced (never modified in place) by step and reorder
+        return self.hidden, self.cell
+
+    def restore(self, entry):
+        # Single beam decoder state from an entry (state(), beam column, attention on the source tail)
+        (hidden, cell), column, _ = entry
+        self.hidden = hidden[:, column:column + 1]
+        self.cell = cell[:, column:column + 1] if cell is not None else None
+
+class TransformerStepper:
+    '''
+        Runs TransformerLangToLang one step at a time with its key/value cache
+        The self attention encoder sees the whole word, so it is re-run on the prefix on every keystroke.
+        Its key/value cache is tied to the memory of one prefix, so decoding is not resumed across keystrokes.
+    '''
+    def __init__(self, model):
+        self.model = model
+        self.encoder = model.encoder
+        self.decoder = model.decoder
+        self.incremental = False
+        self.resumable = False
+
+    def encode(self, source_indices, enc_state, eos_index):
+        source = torch.tensor(source_indices + [eos_index], device=device).unsqueeze(1)
+        self.memory, self.pad_mask = self.encoder(source)
+        self.cache = self.decoder.init_cache()
+        self.position = 0
+
+    def step(self, x):
+        k = x.shape[0]
+        output, _ = self.decoder(x.unsqueeze(0), self.memory.expand(-1, k, -1), self.pad_mask.expand(k, -1), cache=self.cache, start=self.position)
+        self.position += 1
+        return output.squeeze(0)
+
+    def reorder(self, beam_idx):
+        for layer_cache in self.cache:
+            for attn_cache in layer_cache.values():
+                for key in attn_cache:
+                    attn_cache[key] = attn_cache[key].index_select(0, beam_idx)
+
+class StreamingSession:
+    '''
+        Keystroke by keystroke transliteration of one word
+        append(chars) / backspace() update the romanized prefix and return the new candidates
+        Every candidate is (word, log probability), best first.
+
+        Per keystroke cost is bounded by
+            beam_width       -> hypotheses decoded in parallel
+            max_len          -> decoding never runs more than max_len + len_ratio * len(prefix) steps
+            deadline_ms      -> beam search stops and returns the best hypotheses so far once this budget is spent
+        Results of prefixes of the current word which were already decoded (backspace, retyping) are reused without
+        running the model. The memo is cleared by reset() and keeps at most memo_size prefixes (least recently used
+        dropped first), memo_hits / memo_lookups count how often it answered a keystroke.
+        stable_length is the number of leading characters the best candidate shares with the previous keystroke,
+        which the keyboard can show as committed.
+
+        reuse_stable -> (unidirectional recurrent encoder only) the leading characters of the best candidate which stayed
+                        unchanged for commit_after keystrokes are committed : the next beam search restores the decoder
+                        states the previous keystroke computed for them and only branches after them (they are no
+                        longer revised). A character is only committed while its decoder step put at most
+                        reuse_attention attention on <EOS> and the last commit_lookahead typed characters, whose
+                        encoding or meaning the next character can change.
+                        The decoder starts from the final encoder state, which every keystroke changes, so the reused
+                        states are an approximation : this trades accuracy for latency, BenchmarkStreaming measures both.
+        reused_steps counts the decoder steps skipped this way.
+    '''
+    def __init__(self, model, english_vocab, target_vocab, beam_width=3, max_len=8, len_ratio=1.5, deadline_ms=None, memo_size=64, reuse_stable=False, reuse_attention=0.05, commit_lookahead=1, commit_after=3):
+        model.eval()
+        self.english_vocab = english_vocab
+        self.target_vocab = target_vocab
+        self.beam_width = beam_width
+        self.max_len = max_len
+        self.len_ratio = len_ratio
+        self.deadline_ms = deadline_ms
+        self.reuse_stable = reuse_stable
+        self.reuse_attention = reuse_attention
+        self.commit_lookahead = commit_lookahead
+        self.commit_after = commit_after
+        self.reused_steps = 0
+        self.stepper = TransformerStepper(model) if model.decoder.cell_type == "Transformer" else RecurrentStepper(model)
+        self.memo_size = memo_size
+        self.memo = OrderedDict()
+        self.memo_hits = 0
+        self.memo_lookups = 0
+        self.reset()
+
+    def reset(self):
+        self.prefix = ''
+        self.source_indices = []
+        self.enc_states = [([], None)]  # Encoder (outputs, state) after every prefix length, used by backspace
+        self.candidates = []
+        self.stable_length = 0
+        self.stable_runs = []  # Number of consecutive keystrokes every character of the best candidate stayed unchanged
+        self.best_path = None  # (tokens, decoder states, cumulative scores) along the best candidate
+        self.seed = None  # Committed part of best_path the next beam search starts from
+        self.memo.clear()  # Prefixes of the previous word say nothing about the next one
+
+    def append(self, chars):
+        with torch.no_grad():
+            for char in chars.lower():
+                if char not in self.english_vocab.char2index:
+                    continue  # Characters outside the input alphabet are ignored
+                index = self.english_vocab.char2index[char]
+                self.prefix += char
+                self.source_indices.append(index)
+                if self.stepper.incremental:
+                    outputs, state = self.enc_states[-1]
+                    output, state = self.stepper.encode_char(index, state)
+                    self.enc_states.append((outputs + [output], state))
+            if self.reuse_stable and self.stepper.resumable and self.best_path is not None:
+                tokens, history, path = self.best_path
+                committed = 0
+                while (committed < min(len(self.stable_runs), len(tokens)) and self.stable_runs[committed] >= self.commit_after
+                       and history[committed][2] <= self.reuse_attention):
+                    committed += 1
+                if committed > 0:
+                    self.seed = (tokens[:committed], history[:committed], path[:committed])
+            return self.update()
+
+    def backspace(self):
+        self.seed = None  # The committed characters belong to the longer prefix
+        if self.prefix:
+            self.prefix = self.prefix[:-1]
+            self.source_indices.pop()
+            if self.stepper.incremental:
+                self.enc_states.pop()
+        with torch.no_grad():
+            return self.update()
+
+    def update(self):
+        if not self.prefix:
+            candidates, best_path = [], None
+        else:
+            self.memo_lookups += 1
+            if self.prefix in self.memo:
+                self.memo_hits += 1
+                self.memo.move_to_end(self.prefix)
+                candidates, best_path = self.memo[self.prefix]
+            else:
+                candidates, best_path = self.beam_search()
+                self.memo[self.prefix] = (candidates, best_path)
+                if len(self.memo) > self.memo_size:
+                    self.memo.popitem(last=False)  # Least recently used prefix
+
+        previous = self.candidates[0][0] if self.candidates else ''
+        best = candidates[0][0] if candidates else ''
+        self.stable_length = 0
+        while self.stable_length < min(len(previous), len(best)) and previous[self.stable_length] == best[self.stable_length]:
+            self.stable_length += 1
+        self.stable_runs = [self.stable_runs[i] + 1 if i < self.stable_length else 1 for i in range(len(best))]
+        self.candidates = candidates
+        self.best_path = best_path
+        self.seed = None
+        return candidates
+
+    '''
+        Beam search over the current prefix, from <SOS> or from the committed seed
+        Every hypothesis carries its decoder states (one per consumed token, as (stepper.state(), beam column,
+        attention on the source tail) references) and its cumulative scores, so that the best one can seed the next
+        keystroke. Seed = (committed tokens, their decoder states, their scores) : the beam starts as the single
+        committed hypothesis and only branches after it.
+        Returns the candidates and (tokens, states, scores) of the best one
+    '''
+    def beam_search(self):
+        start_time = time.perf_counter()
+        sos = self.target_vocab.char2index[SOS_char]
+        eos = self.target_vocab.char2index[EOS_char]
+        pad = self.target_vocab.char2index[PAD_char]
+        self.stepper.encode(self.source_indices, self.enc_states[-1], self.english_vocab.char2index[EOS_char])
+        max_steps = self.max_len + int(self.len_ratio * len(self.prefix))
+
+        if self.seed is not None and len(self.seed[0]) < max_steps:
+            # Resume after the committed characters : the state before the last one is restored and that character fed
+            committed, history, path = self.seed
+            tokens, histories, paths = [list(committed)], [list(history)], [list(path)]
+            self.stepper.restore(history[-1])
+            scores = torch.tensor([path[-1]], device=device)
+            x = torch.tensor([committed[-1]], device=device)
+            self.reused_steps += len(committed)
+        else:
+            tokens, histories, paths = [[]], [[]], [[]]
+            scores = torch.zeros(1, device=device)
+            x = torch.tensor([sos], device=device)
+
+        finished = []
+        for step in range(len(tokens[0]), max_steps):
+            log_probs = F.log_softmax(self.stepper.step(x), dim=1)
+            state = self.stepper.state() if self.stepper.resumable else None
+            tail = self.stepper.tail_attention(1 + self.commit_lookahead) if self.stepper.resumable else [1.0] * log_probs.shape[0]
+            log_probs[:, sos] = float('-inf')
+            log_probs[:, pad] = float('-inf')
+            log_probs = log_probs + scores.unsqueeze(1)
+
+            top_scores, top_idx = log_probs.view(-1).topk(min(2 * self.beam_width, log_probs.numel()))
+            beam_idx, next_chars, next_scores, next_tokens, next_histories, next_paths = [], [], [], [], [], []
+            for score, idx in zip(top_scores.tolist(), top_idx.tolist()):
+                beam, char = divmod(idx, log_probs.shape[1])
+                if char == eos:
+                    finished.append((tokens[beam], score, histories[beam], paths[beam]))
+                    continue
+                beam_idx.append(beam)
+                next_chars.append(char)
+                next_scores.append(score)
+                next_tokens.append(tokens[beam] + [char])
+                next_histories.append(histories[beam] + [(state, beam, tail[beam])])
+                next_paths.append(paths[beam] + [score])
+                if len(next_tokens) == self.beam_width:
+                    break
+
+            finished.sort(key=lambda hyp: hyp[1], reverse=True)
+            # Scores only decrease with length, so no alive beam can overtake beam_width finished ones
+            done = len(finished) >= self.beam_width and finished[self.beam_width - 1][1] >= next_scores[0] if next_scores else True
+            out_of_time = self.deadline_ms is not None and (time.perf_counter() - start_time) * 1000 > self.deadline_ms
+            if done or out_of_time:
+                break
+
+            beam_idx = torch.tensor(beam_idx, device=device)
+            self.stepper.reorder(beam_idx)
+            tokens, histories, paths = next_tokens, next_histories, next_paths
+            scores = torch.tensor(next_scores, device=device)
+            x = torch.tensor(next_chars, device=device)
+
+        if len(finished) < self.beam_width:
+            finished += list(zip(next_tokens, next_scores, next_histories, next_paths))  # Unfinished hypotheses when the step or time budget ran out
+        finished.sort(key=lambda hyp: hyp[1], reverse=True)
+        candidates = [(''.join(self.target_vocab.index2char[c] for c in hyp), score) for hyp, score, _, _ in finished[:self.beam_width]]
+        best_path = finished[0][0], finished[0][2], finished[0][3]
+        return candidates, best_path
@@ -0,0 +1,212 @@
+import math
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+PAD_index = 2
+
+class PositionalEncoding(nn.Module):
+    '''
+        Adds the fixed sinusoidal position signal to a [seq_len, batchsize, d_model] tensor
+        start -> position of the first row, used while decoding one character at a time
+    '''
+    def __init__(self, d_model, dropout, max_len=256):
+        super(PositionalEncoding, self).__init__()
+        self.dropout = nn.Dropout(dropout)
+        position = torch.arange(max_len).unsqueeze(1)
+        div_term = torch.exp(torch.arange(0, d_model, 2) * (-math.log(10000.0) / d_model))
+        pe = torch.zeros(max_len, 1, d_model)
+        pe[:, 0, 0::2] = torch.sin(position * div_term)
+        pe[:, 0, 1::2] = torch.cos(position * div_term[:d_model // 2])
+        self.register_buffer('pe', pe)
+
+    def forward(self, x, start=0):
+        return self.dropout(x + self.pe[start:start + x.size(0)])
+
+class MultiHeadAttention(nn.Module):
+    '''
+        Scaled dot product attention over time major tensors with an optional key/value cache
+        cache -> dict holding the projected keys and values of the previous calls
+        static_kv -> keys and values do not change between calls (cross attention), they are projected only once
+    '''
+    def __init__(self, d_model, num_heads, dropout):
+        super(MultiHeadAttention, self).__init__()
+        assert d_model % num_heads == 0, "embedding_size must be divisible by num_heads"
+        self.num_heads = num_heads
+        self.head_dim = d_model // num_heads
+        self.q_proj = nn.Linear(d_model, d_model)
+        self.k_proj = nn.Linear(d_model, d_model)
+        self.v_proj = nn.Linear(d_model, d_model)
+        self.out_proj = nn.Linear(d_model, d_model)
+        self.dropout = nn.Dropout(dropout)
+
+    def split_heads(self, x):
+        # [seq_len, batchsize, d_model] -> [batchsize, num_heads, seq_len, head_dim]
+        return x.view(x.size(0), x.size(1), self.num_heads, self.head_dim).permute(1, 2, 0, 3)
+
+    def forward(self, query, key, value, key_padding_mask=None, attn_mask=None, cache=None, static_kv=False):
+        q = self.split_heads(self.q_proj(query))
+        if cache is not None and static_kv and 'k' in cache:
+            k, v = cache['k'], cache['v']  # Memory was already projected on the first step
+        else:
+            k = self.split_heads(self.k_proj(key))
+            v = self.split_heads(self.v_proj(value))
+            if cache is not None:
+                if not static_kv and 'k' in cache:
+                    # Append the new positions to the keys and values of the previous steps
+                    k = torch.cat([cache['k'], k], dim=2)
+                    v = torch.cat([cache['v'], v], dim=2)
+                cache['k'], cache['v'] = k, v
+
+        scores = torch.matmul(q, k.transpose(-2, -1)) / math.sqrt(self.head_dim)  # [batchsize, num_heads, q_len, k_len]
+        if attn_mask is not None:
+            scores = scores.masked_fill(attn_mask, float('-inf'))
+        if key_padding_mask is not None:
+            scores = scores.masked_fill(key_padding_mask[:, None, None, :], float('-inf'))
+
+        attention_weights = F.softmax(scores, dim=-1)
+        context = torch.matmul(self.dropout(attention_weights), v)
+        context = context.permute(2, 0, 1, 3).reshape(q.size(2), q.size(0), -1)  # Back to [q_len, batchsize, d_model]
+        return self.out_proj(context), attention_weights.mean(dim=1)  # Head averaged weights [batchsize, q_len, k_len]
+
+class TransformerEncoderLayer(nn.Module):
+    def __init__(self, d_model, num_heads, ff_size, dropout):
+        super(TransformerEncoderLayer, self).__init__()
+        self.self_attn = MultiHeadAttention(d_model, num_heads, dropout)
+        self.feed_forward = nn.Sequential(nn.Linear(d_model, ff_size), nn.ReLU(), nn.Dropout(dropout), nn.Linear(ff_size, d_model))
+        self.norm1 = nn.LayerNorm(d_model)
+        self.norm2 = nn.LayerNorm(d_model)
+        self.dropout = nn.Dropout(dropout)
+
+    def forward(self, x, pad_mask):
+        attn_out, _ = self.self_attn(x, x, x, key_padding_mask=pad_mask)
+        x = self.norm1(x + self.dropout(attn_out))
+        return self.norm2(x + self.dropout(self.feed_forward(x)))
+
+class TransformerDecoderLayer(nn.Module):
+    def __init__(self, d_model, num_heads, ff_size, dropout):
+        super(TransformerDecoderLayer, self).__init__()
+        self.self_attn = MultiHeadAttention(d_model, num_heads, dropout)
+        self.cross_attn = MultiHeadAttention(d_model, num_heads, dropout)
+        self.feed_forward = nn.Sequential(nn.Linear(d_model, ff_size), nn.ReLU(), nn.Dropout(dropout), nn.Linear(ff_size, d_model))
+        self.norm1 = nn.LayerNorm(d_model)
+        self.norm2 = nn.LayerNorm(d_model)
+        self.norm3 = nn.LayerNorm(d_model)
+        self.dropout = nn.Dropout(dropout)
+
+    def forward(self, x, memory, memory_pad_mask, attn_mask=None, cache=None):
+        self_cache = None if cache is None else cache['self']
+        cross_cache = None if cache is None else cache['cross']
+        attn_out, _ = self.self_attn(x, x, x, attn_mask=attn_mask, cache=self_cache)
+        x = self.norm1(x + self.dropout(attn_out))
+        attn_out, attention_weights = self.cross_attn(x, memory, memory, key_padding_mask=memory_pad_mask, cache=cross_cache, static_kv=True)
+        x = self.norm2(x + self.dropout(attn_out))
+        x = self.norm3(x + self.dropout(self.feed_forward(x)))
+        return x, attention_weights
+
+class TransformerEncoder(nn.Module):
+    '''
+        Character level Transformer encoder built from the same config as the recurrent Encoder
+        embedding_size -> model width, hidden_size -> feed forward width, enc_num_layers -> number of layers
+    '''
+    def __init__(self, config):
+        super(TransformerEncoder, self).__init__()
+        self.cell_type = config['cell_type']
+        self.input_size = config['input_size']
+        self.embedding_size = config['embedding_size']
+        self.hidden_size = config['hidden_size']
+        self.num_layers = config['enc_num_layers']
+        self.num_heads = config.get('num_heads', 4)
+        self.config = config
+        self.embedding = nn.Embedding(self.input_size, self.embedding_size)  # Embedding layer
+        self.position = PositionalEncoding(self.embedding_size, config['dropout'])
+        self.layers = nn.ModuleList([TransformerEncoderLayer(self.embedding_size, self.num_heads, self.hidden_size, config['dropout']) for _ in range(self.num_layers)])
+
+    def forward(self, inp):
+        pad_mask = torch.transpose(inp == PAD_index, 0, 1)  # [batchsize, seq_len], True on the padding positions
+        outputs = self.position(self.embedding(inp) * math.sqrt(self.embedding_size))
+        for layer in self.layers:
+            if self.config.get('checkpoint_chunk', 0) > 0 and self.training and torch.is_grad_enabled():
+                outputs = checkpoint(layer, outputs, pad_mask, use_reentrant=False)  # Layer activations recomputed in backward
+            else:
+                outputs = layer(outputs, pad_mask)
+        return outputs, pad_mask
+
+class TransformerDecoder(nn.Module):
+    '''
+        Character level Transformer decoder
+        Without a cache the whole (teacher forced) target is decoded in parallel under a causal mask,
+        with a cache only the new characters are fed and the keys/values of the earlier steps are reused
+    '''
+    def __init__(self, config):
+        super(TransformerDecoder, self).__init__()
+        self.cell_type = config['cell_type']
+        self.input_size = config['output_size']
+        self.embedding_size = config['embedding_size']
+        self.hidden_size = config['hidden_size']
+        self.output_size = config['output_size']
+        self.num_layers = config['dec_num_layers']
+        self.num_heads = config.get('num_heads', 4)
+        self.config = config
+        self.embedding = nn.Embedding(self.input_size, self.embedding_size)  # Embedding layer
+        self.position = PositionalEncoding(self.embedding_size, config['dropout'])
+        self.layers = nn.ModuleList([TransformerDecoderLayer(self.embedding_size, self.num_heads, self.hidden_size, config['dropout']) for _ in range(self.num_layers)])
+        self.fc1 = nn.Linear(self.embedding_size, self.output_size)  # Fully connected layer for output
+
+    def init_cache(self):
+        # One self attention and one cross attention cache per layer
+        return [{'self': {}, 'cross': {}} for _ in self.layers]
+
+    def forward(self, target, memory, memory_pad_mask, cache=None, start=0):
+        x = self.position(self.embedding(target) * math.sqrt(self.embedding_size), start)
+        attn_mask = None
+        if target.size(0) > 1:
+            # Causal mask, position i may only look at the positions <= start + i
+            attn_mask = torch.triu(torch.ones(target.size(0), start + target.size(0), dtype=torch.bool, device=target.device), diagonal=start + 1)
+        checkpointing = self.config.get('checkpoint_chunk', 0) > 0 and self.training and torch.is_grad_enabled() and cache is None
+        for i, layer in enumerate(self.layers):
+            if checkpointing:
+                x, attention_weights = checkpoint(layer, x, memory, memory_pad_mask, attn_mask, use_reentrant=False)
+            else:
+                x, attention_weights = layer(x, memory, memory_pad_mask, attn_mask, None if cache is None else cache[i])
+        return self.fc1(x), attention_weights
+
+class TransformerLangToLang(nn.Module):
+    '''
+        Same interface as LangToLang : forward(source, target, teacher_force_ratio) -> (outputs, attn_matrix)
+        teacher_force_ratio > 0 -> one parallel teacher forced pass (used for training)
+        teacher_force_ratio = 0 -> greedy decoding with the key/value cache (used for evaluation and inference)
+        return_attention -> also return the last layer cross attention, attn_matrix is None otherwise
+    '''
+    def __init__(self, encoder, decoder):
+        super(TransformerLangToLang, self).__init__()
+        self.encoder = encoder
+        self.decoder = decoder
+
+    def forward(self, source, target, teacher_force_ratio=0.5, return_attention=False):
+        memory, src_pad_mask = self.encoder(source)
+        if teacher_force_ratio > 0:
+            logits, attention_weights = self.decoder(target[:-1], memory, src_pad_mask)
+            outputs = torch.cat([torch.zeros_like(logits[:1]), logits], dim=0)  # Row 0 stays empty like in LangToLang
+            attn_matrix = None
+            if return_attention:
+                attn_w = attention_weights.permute(1, 0, 2)
+                attn_matrix = torch.cat([torch.zeros_like(attn_w[:1]), attn_w], dim=0)
+            return outputs, attn_matrix
+        return self.greedy_decode(memory, src_pad_mask, target[0], target.shape[0], return_attention)
+
+    def greedy_decode(self, memory, src_pad_mask, first_token, target_length, return_attention=False):
+        cache = self.decoder.init_cache()
+        batch_size = first_token.shape[0]
+        outputs = [torch.zeros(1, batch_size, self.decoder.output_size, device=memory.device)]
+        attn_matrix = [torch.zeros(1, batch_size, memory.shape[0], device=memory.device)] if return_attention else None
+        x = first_token.unsqueeze(0)
+        for i in range(1, target_length):
+            output, attn_w = self.decoder(x, memory, src_pad_mask, cache=cache, start=i - 1)  # Only the newest character is decoded
+            outputs.append(output)
+            if return_attention:
+                attn_matrix.append(attn_w.permute(1, 0, 2))
+            x = output.argmax(dim=2)
+        return torch.cat(outputs, dim=0), torch.cat(attn_matrix, dim=0) if return_attention else None
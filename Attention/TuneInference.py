@@ -0,0 +1,78 @@
+import os
+import time
+import torch
+import Attentiontrain
+from Attentiontrain import build_model
+from Attentiontrain import update_config
+from Attentiontrain import load_dataset
+from Alphabets import SOS_char
+from Helpers import Helper
+from InferencePool import ReplicaPool
+
+'''
+    Powers of two up to n, the candidate replica and thread counts
+'''
+def powers_of_two(n):
+    values = []
+    value = 1
+    while value <= n:
+        values.append(value)
+        value *= 2
+    return values
+
+
+def main(args):
+    torch.set_num_threads(1)  # The parent only dispatches, the replicas do the work
+    dataset = load_dataset(args)
+    config = update_config(args, dataset)
+    model = build_model(config).cpu()
+    checkpoint_path = args.model_path if os.path.exists(args.model_path) else None  # Replicas memory map the checkpoint themselves
+    if checkpoint_path is None:
+        print('No checkpoint at', args.model_path, '- timing an untrained model')
+
+    _, _, test_dataloader = dataset.DataSetLoader(args.batch_size)
+    sources = []
+    target_len = 0
+    for batch_idx, (input_seq, target_seq) in enumerate(test_dataloader):
+        if batch_idx == args.num_batches:
+            break
+        sources.append(Helper.TrimBatch(torch.transpose(input_seq, 0, 1).cpu()))
+        target_len = max(target_len, Helper.TrimBatch(torch.transpose(target_seq, 0, 1)).shape[0])
+    n_words = sum(source.shape[1] for source in sources)
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    max_cores = min(args.max_cores or len(cores), len(cores))
+    sos_index = dataset.target_vocab.char2index[SOS_char]
+
+    results = []
+    print(f"{'replicas':>9}{'threads':>9}{'words/s':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for num_replicas in powers_of_two(max_cores):
+        for num_threads in powers_of_two(max_cores // num_replicas):
+            pool_model = None if checkpoint_path else model
+            with ReplicaPool(pool_model, num_replicas, num_threads, sos_index, cores[:max_cores], config, checkpoint_path) as pool:
+                pool.warmup(sources[0], target_len)  # One batch on every replica, outside the timed run
+                start = time.perf_counter()
+                pool.predict(sources, target_len)
+                throughput = n_words / (time.perf_counter() - start)
+                latencies = sorted(pool.latencies)
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            results.append((num_replicas, num_threads, throughput, p95))
+            print(f"{num_replicas:>9}{num_threads:>9}{throughput:>12.1f}{p50:>10.2f}{p95:>10.2f}")
+
+    within_target = [result for result in results if result[3] <= args.target_latency_ms]
+    if within_target:
+        best = max(within_target, key=lambda result: result[2])
+        print(f"Best within p95 <= {args.target_latency_ms} ms : {best[0]} replicas x {best[1]} threads, {best[2]:.1f} words/s")
+    else:
+        print(f"No configuration reaches p95 <= {args.target_latency_ms} ms at batch size {args.batch_size}")
+
+
+if __name__ == "__main__":
+    parser = Attentiontrain.get_parser()
+    parser.description = "Searches replicas x threads per replica for the best CPU inference throughput at a target latency"
+    parser.add_argument('-tl','--target_latency_ms',type=float,default=50.0,help='Target p95 latency of one batch')
+    parser.add_argument('-mc','--max_cores',type=int,default=None,help='Number of cores to use, all available by default')
+    parser.add_argument('-nb','--num_batches',type=int,default=200,help='Number of test batches used per configuration')
+    args = parser.parse_args()
+    main(args)
@@ -2,9 +2,6 @@ import torch.nn as nn
 import torch
 import random 
 
-# Determine if a GPU is available and set the device accordingly
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
 # Define the Encoder class
 class Encoder(nn.Module):
     # Function to create the appropriate RNN cell based on the configuration
@@ -34,12 +31,12 @@ class Encoder(nn.Module):
     def forward(self, inp):
         embedding = self.dropout(self.embedding(inp))
         outputs, cell_data = self.cell(embedding)
-        hidden = cell_data[0]
 
-        # Check if the RNN cell is an LSTM which returns (hidden, cell)
-        if len(cell_data) == 2:
-            cell = cell_data[1]
+        # Check if the RNN cell is an LSTM which returns (hidden, cell), GRU/RNN only return the hidden state tensor
+        if self.cell_type == "LSTM":
+            hidden, cell = cell_data
         else:
+            hidden = cell_data
             cell = None
 
         # Handle bidirectional RNN case
@@ -110,7 +107,8 @@ class LangToLang(nn.Module):
         target_length = target.shape[0]
         target_vocab_size = self.decoder.output_size
 
-        outputs = torch.zeros(target_length, batch_size, target_vocab_size).to(device)
+        # Outputs are collected per step and stacked once, row 0 (the <sos> position) stays zero
+        outputs = [torch.zeros(batch_size, target_vocab_size, device=source.device)]
 
         # Get the initial hidden and cell states from the Encoder
         hidden, cell = self.encoder(source)
@@ -122,10 +120,10 @@ class LangToLang(nn.Module):
         x = target[0]
         for i in range(1, target_length):
             output, hidden, cell = self.decoder(x, hidden, cell)
-            outputs[i] = output
+            outputs.append(output)
             best_guess = output.argmax(dim=1)
 
             # Use teacher forcing
             x = target[i] if random.random() < teacher_force_ratio else best_guess
 
-        return outputs
+        return torch.stack(outputs)
@@ -1,33 +1,28 @@
 # Import necessary libraries
-import pandas as pd
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
-from VanillaSeq2Seq import Encoder
-from VanillaSeq2Seq import Decoder
-from VanillaSeq2Seq import LangToLang
-from vanillahelper import Helper
-from vanilladataset import datasetcreator
+# torch and the data modules are imported inside the functions, so that --help and argument
+# validation return without loading torch, probing CUDA or reading any data
 import argparse
 
-# Set the device to GPU if available, otherwise CPU
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(device)
-
 # Validator class for evaluating the model
 class Validator:
     @staticmethod
     def evaluateModel(model, dataloader, criterion, batch_size):
+        import torch
+        from vanillahelper import Helper
+        device = Helper.Device()
         model.eval()  # Set the model to evaluation mode
         
         total = len(dataloader) * batch_size
         loss_epoch = 0
+        n_tokens = 0
         correct = 0
         
         with torch.no_grad():  # Disable gradient calculation
             for batch_idx, (input_seq, target_seq) in enumerate(dataloader):
                 input_seq = torch.transpose(input_seq, 0, 1).to(device)
                 target_seq = torch.transpose(target_seq, 0, 1).to(device)
+                input_seq = Helper.TrimBatch(input_seq)
+                target_seq = Helper.TrimBatch(target_seq)
                 
                 # Forward pass through the model without teacher forcing
                 output = model(input_seq, target_seq, teacher_force_ratio=0.0)
@@ -40,18 +35,24 @@ class Validator:
                 output = output[1:].reshape(-1, output.shape[2])
                 target = target_seq[1:].reshape(-1)
                 
-                # Calculate loss
+                # Calculate loss, weighted by the number of real target tokens in the batch
                 loss = criterion(output, target)
-                loss_epoch += loss.item()
+                batch_tokens = criterion.token_count(target).item()
+                loss_epoch += loss.item() * batch_tokens
+                n_tokens += batch_tokens
             
             # Calculate accuracy
             accuracy = correct / total * 100.0
-            loss_epoch /= len(dataloader)
+            loss_epoch /= max(n_tokens, 1)
             return loss_epoch, accuracy
 
 # Trainer function for training the model
-def trainer(model, train_dataloader, valid_dataloader, num_epochs, opt_str, batch_size, learning_rate):
-    criterion = nn.CrossEntropyLoss()
+def trainer(model, train_dataloader, valid_dataloader, num_epochs, opt_str, batch_size, learning_rate, label_smoothing=0.0):
+    import torch
+    from vanillahelper import Helper
+    from vanillahelper import PadAwareLoss
+    device = Helper.Device()
+    criterion = PadAwareLoss(label_smoothing=label_smoothing)
     optimizer = Helper.Optimizer(model, opt_str, learning_rate)
     
     for epoch in range(num_epochs):
@@ -63,6 +64,8 @@ def trainer(model, train_dataloader, valid_dataloader, num_epochs, opt_str, batc
         for batch_idx, (input_seq, target_seq) in enumerate(train_dataloader):
             input_seq = torch.transpose(input_seq, 0, 1).to(device)
             target_seq = torch.transpose(target_seq, 0, 1).to(device)
+            input_seq = Helper.TrimBatch(input_seq)
+            target_seq = Helper.TrimBatch(target_seq)
             
             # Forward pass through the model
             output = model(input_seq, target_seq)
@@ -97,13 +100,32 @@ config = {
     'bidirectional': True,
 }
 
-# Create dataset and dataloaders
-dataset = datasetcreator()
-batch_size = 32
-train_dataloader, valid_dataloader, test_dataloader = dataset.datasetcreation()
+# Check the arguments before anything heavy is imported or loaded
+def validate_args(parser, args):
+    for name in ('epochs', 'batch_size', 'embedding_size', 'hidden_size', 'encoder_layers', 'decoder_layers'):
+        if getattr(args, name) <= 0:
+            parser.error(f"--{name} must be positive")
+    if not 0.0 <= args.dropout < 1.0:
+        parser.error("--dropout must be in [0, 1)")
+    if args.learning_rate <= 0:
+        parser.error("--learning_rate must be positive")
 
 # Main function to initialize and train the model
 def main(args):
+    from VanillaSeq2Seq import Encoder
+    from VanillaSeq2Seq import Decoder
+    from VanillaSeq2Seq import LangToLang
+    from vanillahelper import Helper
+    from vanillahelper import PadAwareLoss
+    from vanilladataset import datasetcreator
+    device = Helper.Device()
+    print(device)
+
+    # Create dataset and dataloaders
+    batch_size = args.batch_size
+    dataset = datasetcreator()
+    train_dataloader, valid_dataloader, test_dataloader = dataset.datasetcreation(args.path, args.target_lang, batch_size, prune_vocab=args.prune_vocab)
+
     config['cell_type'] = args.cell_type
     config['embedding_size'] = args.embedding_size
     config['hidden_size'] = args.hidden_size
@@ -116,8 +138,8 @@ def main(args):
     epochs = args.epochs
     learning_rate = args.learning_rate
 
-    input_size_encoder = 29
-    input_size_decoder = 131
+    input_size_encoder = dataset.english_vocab.n_chars
+    input_size_decoder = dataset.target_vocab.n_chars
     output_size = input_size_decoder
     
     # Update config dictionary with input and output sizes
@@ -133,10 +155,10 @@ def main(args):
         
     # Train the model
     opt_str = args.optimizer
-    trainer(model, train_dataloader, valid_dataloader, epochs, opt_str, batch_size, learning_rate)
+    trainer(model, train_dataloader, valid_dataloader, epochs, opt_str, batch_size, learning_rate, args.label_smoothing)
     
     # Evaluate the model on the test dataset
-    loss, acc = Validator.evaluateModel(model, test_dataloader, nn.CrossEntropyLoss(), batch_size) 
+    loss, acc = Validator.evaluateModel(model, test_dataloader, PadAwareLoss(), batch_size) 
     print('Test Loss:', loss)
     print('Test Accuracy:', acc)
     
@@ -149,13 +171,17 @@ if __name__ == "__main__":
     parser.add_argument("-b","--batch_size",type=int,default = 32,help='Batch size used to train neural network.')  
     parser.add_argument('-lr','--learning_rate',type=float,default=0.001,help='Learning rate used to optimize model parameters')
     parser.add_argument('-t','--target_lang',type=str,default='hin',help='Target Language in which transliteration system works')
-    parser.add_argument('-ct',"--cell_type",type=str,default="LSTM",help='Type of cell to be used in architecture Choose b/w [LSTM,RNN,GRU]')
+    parser.add_argument('-ct',"--cell_type",type=str,default="LSTM",choices=['LSTM','RNN','GRU'],help='Type of cell to be used in architecture Choose b/w [LSTM,RNN,GRU]')
     parser.add_argument('-em','--embedding_size',type=int,default=128,help='size of embedding to be used in encoder decoder')
     parser.add_argument('-hi','--hidden_size',type=int,default=512,help='Hidden layer size of encoder and decoder')
     parser.add_argument('-el',"--encoder_layers",type=int,default=4,help='Number of hidden layers in encoder')
     parser.add_argument('-dl',"--decoder_layers",type=int,default=4,help='Number of hidden layers in decoder')
     parser.add_argument('-dr','--dropout',type=float,default=0.2,help='dropout probability')
-    parser.add_argument('-bi',"--bidirectional",type=bool,default=True,help='Whether you want the data to be read from both directions')
+    parser.add_argument('-bi',"--bidirectional",type=lambda x: x.lower() == 'true',default=True,help='Whether you want the data to be read from both directions')
     parser.add_argument('-op','--optimizer',type=str,default='Adam',help='choices: ["Sgd","Adam", "Nadam"]')  
+    parser.add_argument('-ls','--label_smoothing',type=float,default=0.0,help='Label smoothing used in the pad aware loss')
+    parser.add_argument('-pv','--prune_vocab',type=lambda x: x.lower() == 'true',default=False,help='Target vocabulary only holds the characters seen in the data instead of the whole Unicode block')
+    parser.add_argument('-p','--path',type=str,default='/content/drive/MyDrive/aksharantar_sampled/',help='Folder containing the language folders of the dataset')
     args = parser.parse_args()
+    validate_args(parser, args)
     main(args)
\ No newline at end of file
@@ -1,38 +1,44 @@
-# Import necessary libraries
+# Import necessary libraries (pandas is only imported once data is actually loaded)
 from vanillahelper import Helper
-import pandas as pd
-import torch
 from torch.utils.data import DataLoader, TensorDataset
 
-# Set the device to GPU if available, otherwise CPU
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
 # Define the datasetcreator class
 class datasetcreator:
-    def datasetcreation(self):
-        # Define the source and target languages
-        inp_lang = 'eng'
-        target_lang = 'hin'
-        PATH_TO_DATA = 'D:\\Deep Learning\\Assignment 4 RNN LSTM GRU\\aksharantar_sampled\\aksharantar_sampled\\hin' + target_lang
+    # Unicode range of the script of every supported target language
+    script_ranges = {'hin': (2304, 2432), 'ben': (2432, 2560), 'tel': (3072, 3199)}
+
+    # prune_vocab -> the target vocabulary only holds the characters seen in the data instead of the whole Unicode block
+    def datasetcreation(self, path, target_lang='hin', batch_size=32, inp_lang='eng', prune_vocab=False):
+        import pandas as pd
+        device = Helper.Device()
+        PATH_TO_DATA = path + target_lang
 
-        # Define the alphabets for English and target language (Hindi)
+        # Define the alphabets for English and target language
         eng_alphabets = 'abcdefghijklmnopqrstuvwxyz'
         tar_alphabets = ''
-        for alpha in range(2304, 2432):  # Unicode range for Devanagari script
+        first, last = self.script_ranges.get(target_lang, self.script_ranges['tel'])
+        for alpha in range(first, last):
             tar_alphabets += chr(alpha)
-
         # Load datasets from CSV files
-        TrainDataFrame = pd.read_csv('/content/drive/MyDrive/aksharantar_sampled/hin/hin_train.csv', header=None)
+        TrainDataFrame = pd.read_csv(PATH_TO_DATA + '/' + target_lang + '_train.csv', header=None)
         train_data = TrainDataFrame.values
 
-        VadiationDataFrame = pd.read_csv('/content/drive/MyDrive/aksharantar_sampled/hin/hin_valid.csv', header=None)
+        VadiationDataFrame = pd.read_csv(PATH_TO_DATA + '/' + target_lang + '_valid.csv', header=None)
         valid_data = VadiationDataFrame.values
 
-        TestDataFrame = pd.read_csv('/content/drive/MyDrive/aksharantar_sampled/hin/hin_test.csv', header=None)
+        TestDataFrame = pd.read_csv(PATH_TO_DATA + '/' + target_lang + '_test.csv', header=None)
         test_data = TestDataFrame.values
 
+        if prune_vocab:
+            # Training characters first, then the few only present in validation / test (never predicted correctly, but encodable)
+            seen = set(''.join(train_data[:, 1]))
+            extra = set(''.join(valid_data[:, 1]) + ''.join(test_data[:, 1])) - seen
+            tar_alphabets = ''.join(sorted(seen)) + ''.join(sorted(extra))
+
         # Build vocabulary for English and target language
         english_vocab, target_vocab = Helper.LanguageVocabulary([[eng_alphabets, tar_alphabets]], inp_lang, target_lang)
+        self.english_vocab = english_vocab
+        self.target_vocab = target_vocab
 
         print(english_vocab.n_chars)
         print(target_vocab.n_chars)
@@ -51,7 +57,6 @@ class datasetcreator:
         n_valid = english_valid.size(0)
 
         print(n_train, n_valid)
-        batch_size = 32
 
         # Create TensorDatasets and DataLoaders for training, validation, and test sets
         train_dataset = TensorDataset(english_train, target_train)
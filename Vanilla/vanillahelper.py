@@ -1,11 +1,13 @@
 from torch import optim
 from torch.nn.utils.rnn import pad_sequence
 import torch
+import torch.nn as nn
 
 # Define special characters for Start of Sequence, End of Sequence, and Padding
 SOS_char = "<SOS>"
 EOS_char = "<EOS>"
 PAD_char = ""
+PAD_index = 2
 
 # Class to create and manage an alphabet for a language
 class AlphabetCreation:
@@ -26,8 +28,24 @@ class AlphabetCreation:
             else:
                 self.char2count[char] += 1
 
+# Cross entropy on the logits which ignores padding and normalizes by the number of real tokens
+class PadAwareLoss(nn.Module):
+    def __init__(self, pad_index=PAD_index, label_smoothing=0.0):
+        super(PadAwareLoss, self).__init__()
+        self.pad_index = pad_index
+        self.criterion = nn.CrossEntropyLoss(ignore_index=pad_index, label_smoothing=label_smoothing, reduction='sum')
+
+    def token_count(self, target):
+        return (target != self.pad_index).sum()
+
+    def forward(self, output, target):
+        n_tokens = self.token_count(target).clamp(min=1)
+        return self.criterion(output, target) / n_tokens
+
 # Helper class with static methods for various tasks
 class Helper:
+    _device = None
+
     @staticmethod
     def LanguageVocabulary(data, input_lang, output_lang):
         # Create vocabularies for input and output languages
@@ -61,6 +79,22 @@ class Helper:
         word_tensor_pad = pad_sequence(tensor_list, padding_value=2, batch_first=True)
         return word_tensor_pad
     
+    @staticmethod
+    def Device():
+        # Probe CUDA on first use instead of at import time
+        if Helper._device is None:
+            Helper._device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        return Helper._device
+
+    @staticmethod
+    def TrimBatch(seq, pad_index=PAD_index):
+        # Drop the trailing rows of a [max_seq_len, batchsize] tensor which are padding for every sequence
+        not_pad = (seq != pad_index).any(dim=1)
+        if not not_pad.any():
+            return seq
+        length = not_pad.nonzero()[-1].item() + 1
+        return seq[:length]
+
     @staticmethod
     def Optimizer(model, opt, learning_rate):
         if opt == 'Adam':
@@ -0,0 +1,69 @@
+# Startup benchmark of the vanilla entry points
+# Every command runs in a fresh interpreter, the way the short lived jobs are spawned
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = [
+    ('interpreter only', ['-c', 'pass']),
+    ('vanilla.py --help', ['vanilla.py', '--help']),
+    ('invalid config', ['vanilla.py', '--dropout', '2']),
+    ('import vanilla', ['-c', 'import vanilla']),
+    ('import VanillaSeq2Seq', ['-c', 'import VanillaSeq2Seq']),
+]
+
+# Wall time of one cold run of the command in milliseconds
+def time_command(command):
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + command, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+# Rows of python -X importtime for "import VanillaSeq2Seq" : (self ms, cumulative ms, nesting level, module)
+# A module is printed after everything it imports, every nesting level adds two spaces of indentation
+def import_times():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import VanillaSeq2Seq'], cwd=HERE, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            self_us = int(parts[0].split(':')[1])
+            name = parts[2].rstrip()
+            level = (len(name) - len(name.lstrip()) - 1) // 2
+            rows.append((self_us / 1000, int(parts[1]) / 1000, level, name.strip()))
+    return rows
+
+# Modules imported directly by VanillaSeq2Seq (the rows one level below it, printed just before it) by cumulative time
+def direct_imports(rows):
+    children = []
+    for self_ms, cumulative, level, name in rows:
+        if level == 0:
+            if name == 'VanillaSeq2Seq':
+                return sorted(children, reverse=True)
+            children = []
+        elif level == 1:
+            children.append((cumulative, name))
+    return []
+
+def main(args):
+    print(f"{'command':<24}{'mean ms':>10}{'min ms':>10}")
+    for name, command in COMMANDS:
+        times = [time_command(command) for _ in range(args.repeats)]
+        print(f"{name:<24}{sum(times) / len(times):>10.1f}{min(times):>10.1f}")
+    rows = import_times()
+    print("Direct imports of VanillaSeq2Seq (cumulative ms):")
+    for cumulative, name in direct_imports(rows)[:args.top]:
+        print(f"  {name:<50}{cumulative:>10.1f}")
+    print(f"Slowest {args.top} modules by self time (ms, excluding their own imports):")
+    for self_ms, _, _, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"  {name:<50}{self_ms:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start time of vanilla.py and of importing the model classes")
+    parser.add_argument('-r','--repeats',type=int,default=5,help='Number of cold runs per command')
+    parser.add_argument('-n','--top',type=int,default=5,help='Number of slowest imports to list')
+    args = parser.parse_args()
+    main(args)